@@ -0,0 +1,186 @@
+"""
+Conversão em Lote
+
+Distribui a conversão de muitos arquivos PDF/imagem entre um pool de processos dimensionado
+para os núcleos disponíveis, usando o motor de `converter`.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+
+from converter import ConversionError, EncodeStats, available_cores, convert_file
+from instrumentation import profiled
+
+
+@dataclass
+class BatchJob:
+    template_path: str
+    source_path: str
+    output_dir: str = None
+
+
+@dataclass
+class BatchOutcome:
+    job: BatchJob
+    instance_count: int = 0
+    page_count: int = 0
+    output_files: list = field(default_factory=list)
+    stored_instances: int = 0
+    elapsed: float = 0.0
+    error: str = None
+    series_instance_uid: str = None
+    encode_stats: EncodeStats = field(default_factory=EncodeStats)
+    timings: dict = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def report_record(self):
+        """One JSON-serializable line of the run report: throughput, sizes and stage timings."""
+        stats = self.encode_stats
+        elapsed = self.elapsed or float("inf")
+        record = {
+            "source": self.job.source_path, "template": self.job.template_path, "ok": self.ok, "error": self.error,
+            "pages": self.page_count, "instances": self.instance_count, "stored_instances": self.stored_instances,
+            "elapsed": round(self.elapsed, 6), "pages_per_second": round(self.page_count / elapsed, 3),
+            "pixel_mb_per_second": round(stats.pixel_bytes / 1e6 / elapsed, 3), "pixel_bytes": stats.pixel_bytes,
+            "encoded_bytes": stats.encoded_bytes if stats.measured else None, "encode_seconds": round(stats.encode_seconds, 6),
+        }
+        record.update(self.timings or {})
+        return record
+
+
+@dataclass
+class BatchSummary:
+    outcomes: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def succeeded(self):
+        return sum(1 for o in self.outcomes if o.ok)
+
+    @property
+    def failed(self):
+        return len(self.outcomes) - self.succeeded
+
+    @property
+    def instance_count(self):
+        return sum(o.instance_count for o in self.outcomes)
+
+    @property
+    def page_count(self):
+        return sum(o.page_count for o in self.outcomes)
+
+    @property
+    def encode_stats(self):
+        total = EncodeStats()
+        for o in self.outcomes: total.add(o.encode_stats)
+        return total
+
+    @property
+    def pages_per_second(self):
+        return self.page_count / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def load_manifest(manifest_path):
+    """
+    Read a manifest mapping each source file to its template DICOM.
+
+    Accepts CSV with a `source,template[,output_dir]` header or JSON holding a list of objects with
+    the same keys. Relative paths are resolved against the manifest's folder.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(manifest_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+    def resolve(path):
+        return os.path.join(base_dir, path) if path and not os.path.isabs(path) else path
+
+    jobs = []
+    for line_number, row in enumerate(rows, start=1):
+        if not row.get("source") or not row.get("template"):
+            raise ValueError(f"Entrada {line_number} do manifesto sem 'source' ou 'template'.")
+        jobs.append(BatchJob(resolve(row["template"]), resolve(row["source"]), resolve(row.get("output_dir") or None)))
+    return jobs
+
+
+def profile_filename(profile_dir, index, job):
+    """Name of the cProfile dump of the `index`-th job, e.g. 0003_laudo.pdf.prof."""
+    return os.path.join(profile_dir, f"{index:04d}_{os.path.basename(job.source_path)}.prof") if profile_dir else None
+
+
+def run_job(job, convert_options=None, profile_path=None):
+    """Convert one job, turning any failure into an outcome so the batch keeps going."""
+    start_time = time.perf_counter()
+    try:
+        with profiled(profile_path):
+            result = convert_file(job.template_path, job.source_path, job.output_dir, **(convert_options or {}))
+        return BatchOutcome(job, result.instance_count, result.page_count, result.output_files, result.stored_instances,
+                            time.perf_counter() - start_time,
+                            series_instance_uid=result.series_instance_uid, encode_stats=result.encode_stats,
+                            timings=result.timings)
+    except ConversionError as e:
+        error = f"{e.title}: {e}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    return BatchOutcome(job, elapsed=time.perf_counter() - start_time, error=error)
+
+
+def job_executor(workers, isolate_jobs=False):
+    """
+    Process pool for conversion jobs. With `isolate_jobs`, every job runs in a fresh process
+    (Python 3.11+), so the peak RSS in its report is its own and not the worker's highest so far.
+    """
+    if isolate_jobs and sys.version_info >= (3, 11):
+        return ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def run_batch(jobs, workers=None, on_outcome=None, convert_options=None, profile_dir=None, isolate_jobs=False):
+    """
+    Convert `jobs` across a process pool and return a BatchSummary.
+
+    `workers` defaults to the number of available cores; with a single worker the jobs run in this
+    process. `on_outcome` is called with each BatchOutcome as soon as it finishes. `convert_options`
+    are passed as keyword arguments to convert_file for every job (e.g. output_mode). With
+    `profile_dir`, each job runs under cProfile and its stats are dumped there (see profile_filename).
+    `isolate_jobs` runs every job in its own process (see job_executor), even with a single worker.
+    """
+    workers = max(1, min(workers or available_cores(), len(jobs) or 1))
+    convert_options = dict(convert_options or {})
+    # Files are already spread across processes; share the remaining cores for page encoding
+    convert_options.setdefault("encode_workers", max(1, available_cores() // workers))
+    job_runner = partial(run_job, convert_options=convert_options)
+    summary = BatchSummary()
+    start_time = time.perf_counter()
+
+    def collect(outcome):
+        summary.outcomes.append(outcome)
+        if on_outcome: on_outcome(outcome)
+
+    if workers == 1 and not isolate_jobs:
+        for i, job in enumerate(jobs):
+            collect(job_runner(job, profile_path=profile_filename(profile_dir, i, job)))
+    else:
+        with job_executor(workers, isolate_jobs) as executor:
+            futures = [executor.submit(job_runner, job, profile_path=profile_filename(profile_dir, i, job)) for i, job in enumerate(jobs)]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    summary.elapsed = time.perf_counter() - start_time
+    return summary
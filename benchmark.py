@@ -0,0 +1,264 @@
+"""
+Benchmark de Conversão
+
+Gera documentos sintéticos (PDFs e imagens com número de páginas, tamanho e modo de cor
+controlados) e DICOMs modelo sintéticos, converte cada cenário algumas vezes e informa a vazão
+(páginas/s e MB/s de pixels), o tempo de cada etapa e o pico de memória. Não usa dados de pacientes,
+então pode ser executado em qualquer máquina para comparar versões.
+
+Uso: python benchmark.py --pages 20 --formats pdf,png --colors rgb,gray --compression none,rle
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid, PYDICOM_IMPLEMENTATION_UID
+from PIL import Image
+
+from batch import BatchJob, run_job
+from converter import (COMPRESSION_NONE, COMPRESSION_TRANSFER_SYNTAXES, OUTPUT_MODE_RASTER, OUTPUT_MODES, PDF_RENDER_DPI,
+                       RenderPolicy)
+from instrumentation import append_report
+
+COLOR_MODES = ("rgb", "gray", "bilevel")
+SOURCE_FORMATS = ("pdf", "png", "jpg", "tiff")
+DEFAULT_PAGE_SIZE = (1240, 1754) # A4 at 150 dpi
+CT_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.2"
+
+
+def synthetic_page(width, height, color_mode, rng):
+    """
+    Return a document-like page: rows of dark "words" on white, as a PIL image.
+
+    `gray` pages add a photo-like gradient, `rgb` pages also a colored chart, and `bilevel`
+    pages are pure black and white.
+    """
+    page = np.full((height, width), 255, dtype=np.uint8)
+    line_height = max(height // 80, 2)
+    margin = width // 12
+    for top in range(margin, height - margin - line_height, line_height * 2):
+        x = margin
+        while x < width - margin:
+            word = int(rng.integers(line_height, line_height * 6))
+            page[top:top + line_height, x:min(x + word, width - margin)] = 0 if color_mode == "bilevel" else rng.integers(0, 80)
+            x += word + line_height
+    if color_mode == "bilevel":
+        return Image.fromarray(page, "L")
+
+    box = (slice(height // 2, height // 2 + height // 5), slice(margin, width - margin))
+    gradient = np.linspace(30, 230, page[box].shape[1], dtype=np.uint8)
+    page[box] = gradient + rng.integers(0, 16, page[box].shape, dtype=np.uint8) # Scanned-photo noise
+    if color_mode == "gray":
+        return Image.fromarray(page, "L")
+
+    rgb = np.repeat(page[..., None], 3, axis=2)
+    chart = (slice(height // 4, height // 4 + height // 8), slice(margin, width // 2))
+    rgb[chart] = rng.integers(0, 256, 3, dtype=np.uint8) # One solid colored block
+    return Image.fromarray(rgb, "RGB")
+
+
+def write_synthetic_source(path, source_format, page_count, size, color_mode, seed=0):
+    """Write a `page_count`-page PDF, or a single image, of synthetic pages to `path`."""
+    rng = np.random.default_rng(seed)
+    if source_format == "pdf":
+        pages = [synthetic_page(*size, color_mode, rng) for _ in range(page_count)]
+        # At the default PDF_RENDER_DPI, Poppler renders each page back at exactly `size` pixels
+        pages[0].save(path, save_all=True, append_images=pages[1:], resolution=PDF_RENDER_DPI)
+        return
+    image = synthetic_page(*size, color_mode, rng)
+    if source_format == "jpg": image.save(path, quality=90)
+    else: image.save(path)
+
+
+def write_synthetic_template(path, pixel_megabytes=0):
+    """
+    Write a template DICOM with a synthetic patient and study.
+
+    `pixel_megabytes` adds CT-like pixel data, to measure templates taken from large studies.
+    """
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = CT_IMAGE_STORAGE
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.ImplementationClassUID = PYDICOM_IMPLEMENTATION_UID
+    ds.SpecificCharacterSet = "ISO_IR 100"
+    ds.SOPClassUID = CT_IMAGE_STORAGE
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    ds.PatientName = "SINTETICO^BENCHMARK"
+    ds.PatientID = "BENCH0001"
+    ds.PatientBirthDate = "19700101"
+    ds.PatientSex = "O"
+    ds.StudyInstanceUID = generate_uid()
+    ds.StudyDate = "20250101"
+    ds.StudyTime = "120000"
+    ds.StudyID = "1"
+    ds.AccessionNumber = "BENCH"
+    ds.StudyDescription = "Benchmark"
+    ds.SeriesInstanceUID = generate_uid()
+    ds.SeriesNumber = "1"
+    ds.Modality = "CT"
+    if pixel_megabytes:
+        side = int((pixel_megabytes * 1e6 / 2) ** 0.5)
+        ds.Rows = ds.Columns = side
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.PixelData = np.zeros((side, side), dtype=np.uint16).tobytes()
+    pydicom.dcmwrite(path, ds, write_like_original=False)
+
+
+def _run_isolated(job, convert_options):
+    # A fresh process per run keeps peak RSS and caches from leaking between runs
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run_job, job, convert_options).result()
+
+
+def _format_stages(stages, elapsed):
+    ranked = sorted(stages.items(), key=lambda item: -item[1]["seconds"])[:4]
+    return " ".join(f"{name}={100 * stage['seconds'] / elapsed:.0f}%" for name, stage in ranked)
+
+
+def run_scenario(workdir, template_path, source_format, color_mode, compression, args):
+    """Convert one synthetic scenario `args.repeat` times and return its report records."""
+    scenario = f"{source_format}/{color_mode}/{compression}"
+    source_dir = os.path.join(workdir, scenario.replace("/", "_"))
+    os.makedirs(source_dir, exist_ok=True)
+    file_count = 1 if source_format == "pdf" else args.pages
+    sources = []
+    for i in range(file_count):
+        path = os.path.join(source_dir, f"pagina_{i + 1:03d}.{source_format}")
+        write_synthetic_source(path, source_format, args.pages, args.size, color_mode, seed=args.seed + i)
+        sources.append(path)
+
+    convert_options = {"output_mode": args.mode, "compression": compression, "multiframe": args.multiframe,
+                       "bilevel": args.bilevel, "encode_workers": args.encode_workers, "instrument": True,
+                       "trace_memory": args.trace_memory,
+                       "render_policy": RenderPolicy(args.dpi, int(args.max_page_megapixels * 1e6) if args.max_page_megapixels else None,
+                                                     args.gray_render, args.render_threads)}
+    records = []
+    for repeat in range(args.repeat):
+        output_dir = os.path.join(source_dir, f"saida_{repeat}")
+        os.makedirs(output_dir)
+        for source in sources:
+            outcome = _run_isolated(BatchJob(template_path, source, output_dir), convert_options)
+            if not outcome.ok:
+                raise RuntimeError(f"{scenario}: {outcome.error}")
+            record = outcome.report_record()
+            record.update(scenario=scenario, repeat=repeat, size=list(args.size), multiframe=args.multiframe)
+            records.append(record)
+        shutil.rmtree(output_dir)
+    return records
+
+
+def summarize(scenario, records):
+    """Median pages/s and MB/s over the repeats of one scenario, plus its stage breakdown."""
+    by_repeat = {}
+    for record in records:
+        totals = by_repeat.setdefault(record["repeat"], {"pages": 0, "pixel_bytes": 0, "elapsed": 0.0, "rss": 0, "stages": {}})
+        totals["pages"] += record["pages"]
+        totals["pixel_bytes"] += record["pixel_bytes"]
+        totals["elapsed"] += record["elapsed"]
+        totals["rss"] = max(totals["rss"], record.get("peak_rss_bytes") or 0, record.get("peak_child_rss_bytes") or 0)
+        for name, stage in record.get("stages", {}).items():
+            totals["stages"].setdefault(name, {"seconds": 0.0})["seconds"] += stage["seconds"]
+    pages_per_second = statistics.median(t["pages"] / t["elapsed"] for t in by_repeat.values())
+    mb_per_second = statistics.median(t["pixel_bytes"] / 1e6 / t["elapsed"] for t in by_repeat.values())
+    last = by_repeat[max(by_repeat)]
+    return (f"{scenario:<24} {pages_per_second:8.2f} páginas/s {mb_per_second:8.1f} MB/s "
+            f"pico RSS {last['rss'] / 1e6:7.1f} MB  {_format_stages(last['stages'], last['elapsed'])}")
+
+
+def _pdf_rendering_available(workdir):
+    from pdf2image import pdfinfo_from_path
+    probe = os.path.join(workdir, "probe.pdf")
+    write_synthetic_source(probe, "pdf", 1, (64, 64), "bilevel")
+    try:
+        pdfinfo_from_path(probe)
+        return True
+    except Exception:
+        return False
+
+
+def _csv_choices(choices):
+    def parse(text):
+        values = [v.strip() for v in text.split(",") if v.strip()]
+        invalid = [v for v in values if v not in choices]
+        if invalid or not values:
+            raise argparse.ArgumentTypeError(f"valores válidos: {', '.join(choices)}")
+        return values
+    return parse
+
+
+def _page_size(text):
+    try:
+        width, height = (int(v) for v in text.lower().split("x"))
+        return width, height
+    except ValueError:
+        raise argparse.ArgumentTypeError("use LARGURAxALTURA, por exemplo 1240x1754") from None
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark da conversão com documentos e modelos DICOM sintéticos.")
+    parser.add_argument("--pages", type=int, default=10, help="Páginas por PDF, ou número de imagens (padrão: 10).")
+    parser.add_argument("--size", type=_page_size, default=DEFAULT_PAGE_SIZE, help="Tamanho da página em pixels (padrão: 1240x1754).")
+    parser.add_argument("--formats", type=_csv_choices(SOURCE_FORMATS), default=["pdf", "png"], help="Formatos de origem (padrão: pdf,png).")
+    parser.add_argument("--colors", type=_csv_choices(COLOR_MODES), default=list(COLOR_MODES), help="Modos de cor (padrão: rgb,gray,bilevel).")
+    parser.add_argument("--compression", type=_csv_choices(list(COMPRESSION_TRANSFER_SYNTAXES)), default=[COMPRESSION_NONE],
+                        help="Compressões a comparar (padrão: none).")
+    parser.add_argument("--mode", choices=OUTPUT_MODES, default=OUTPUT_MODE_RASTER)
+    parser.add_argument("--multiframe", action="store_true", help="Grava cada arquivo como uma instância multi-frame.")
+    parser.add_argument("--bilevel", action="store_true", help="Ativa a conversão de páginas quase preto e branco.")
+    parser.add_argument("--dpi", type=int, default=PDF_RENDER_DPI, help=f"Resolução da renderização dos PDFs (padrão: {PDF_RENDER_DPI}).")
+    parser.add_argument("--max-page-megapixels", type=float, help="Limite de megapixels por página de PDF.")
+    parser.add_argument("--gray-render", action="store_true", help="Renderiza os PDFs diretamente em tons de cinza.")
+    parser.add_argument("--render-threads", type=int, help="Trechos de páginas renderizados em paralelo.")
+    parser.add_argument("--encode-workers", type=int, help="Processos de codificação (padrão: núcleos disponíveis).")
+    parser.add_argument("--template-mb", type=float, default=0, help="Tamanho dos pixels do DICOM modelo, em MB (padrão: 0).")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições de cada cenário; é informada a mediana (padrão: 3).")
+    parser.add_argument("--seed", type=int, default=0, help="Semente dos documentos sintéticos (padrão: 0).")
+    parser.add_argument("--trace-memory", action="store_true", help="Mede também o pico de memória com tracemalloc.")
+    parser.add_argument("--report", default="benchmark.jsonl", help="Relatório JSON Lines, uma linha por arquivo convertido (padrão: benchmark.jsonl).")
+    parser.add_argument("--workdir", help="Pasta para os arquivos sintéticos (padrão: pasta temporária, removida ao final).")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="img2dicom_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        template_path = os.path.join(workdir, "template.dcm")
+        write_synthetic_template(template_path, args.template_mb)
+        formats = args.formats
+        if "pdf" in formats and not _pdf_rendering_available(workdir):
+            print("Poppler não encontrado: cenários PDF ignorados.", file=sys.stderr)
+            formats = [f for f in formats if f != "pdf"]
+
+        print(f"{args.pages} página(s) de {args.size[0]}x{args.size[1]}, {args.repeat} repetição(ões); relatório em {args.report}")
+        for source_format, color_mode, compression in itertools.product(formats, args.colors, args.compression):
+            scenario = f"{source_format}/{color_mode}/{compression}"
+            records = run_scenario(workdir, template_path, source_format, color_mode, compression, args)
+            for record in records: append_report(args.report, record)
+            print(summarize(scenario, records))
+    finally:
+        if not args.workdir: shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1026 @@
+"""
+Motor de Conversão de PDF/Imagem para DICOM
+
+Contém toda a lógica de conversão, sem dependência da interface gráfica, para que possa ser
+usada tanto pelo aplicativo Tkinter quanto pelo modo de linha de comando (lote).
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import (generate_uid, ExplicitVRLittleEndian, DeflatedExplicitVRLittleEndian, RLELossless,
+                         PYDICOM_IMPLEMENTATION_UID)
+from PIL import Image, UnidentifiedImageError # Pillow is imported as PIL
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+import contextlib
+import functools
+import os
+import datetime
+import tempfile
+import time
+
+from instrumentation import NO_TIMINGS, StageTimings, timed_iter
+from multiframe import MAX_PIXEL_DATA_LENGTH, RLE_ENCODING_PLUGIN, FrameSpool, write_multiframe, write_strips
+
+SECONDARY_CAPTURE_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.7"
+MULTIFRAME_GRAYSCALE_BYTE_SC_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.7.2"
+MULTIFRAME_TRUE_COLOR_SC_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.7.4"
+ENCAPSULATED_PDF_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.104.1"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif", ".gif")
+SUPPORTED_EXTENSIONS = (".pdf",) + IMAGE_EXTENSIONS
+PDF_RENDER_DPI = 300
+PDF_PAGE_WINDOW = 4 # Pages rasterized per pdf2image call, and pages queued for encoding, when streaming a document
+MIN_RENDER_DPI = 36 # Floor for pages shrunk to fit RenderPolicy.max_page_pixels
+PDFINFO_LAST_PAGE = 1_000_000 # pdfinfo clamps -l to the page count
+
+# Output modes. Encapsulated PDF stores the original PDF bytes and only applies to PDF sources;
+# images are always stored as Secondary Capture pixel data.
+OUTPUT_MODE_RASTER = "raster"
+OUTPUT_MODE_ENCAPSULATED_PDF = "encapsulated-pdf"
+OUTPUT_MODES = (OUTPUT_MODE_RASTER, OUTPUT_MODE_ENCAPSULATED_PDF)
+
+# Template attributes copied into the new series. Only these are parsed from the template DICOM.
+TEMPLATE_TAGS = [
+    "SpecificCharacterSet", "PatientName", "PatientID", "PatientBirthDate", "PatientSex",
+    "StudyInstanceUID", "StudyDate", "StudyTime", "ReferringPhysicianName", "StudyID",
+    "AccessionNumber", "StudyDescription", "SeriesNumber", "Laterality",
+]
+TEMPLATE_CACHE_SIZE = 32
+
+# Grayscale/bilevel detection. A page counts as near-bilevel when at least BILEVEL_MIN_FRACTION of its
+# pixels lie within BILEVEL_TOLERANCE of pure black or white.
+GRAYSCALE_PROBE_STEP = 16 # Subsampling used to reject color pages before the full channel comparison
+BILEVEL_TOLERANCE = 48
+BILEVEL_MIN_FRACTION = 0.98
+
+# Pages above LARGE_IMAGE_PIXELS (large scans, posters) are converted and written in bands of about
+# STRIP_PIXELS pixels, so the mode-converted and tobytes() copies never exist at full size.
+LARGE_IMAGE_PIXELS = 32_000_000
+STRIP_PIXELS = 2_000_000
+# Largest page accepted from an image file (about 1.5 GB once decoded as RGB). It replaces Pillow's own
+# decompression-bomb check, which warns from 89 MP and fails with a traceback from 179 MP, so large scans
+# up to this size convert quietly and anything bigger is a clean ImageTooLargeError.
+MAX_IMAGE_PIXELS = 500_000_000
+Image.MAX_IMAGE_PIXELS = None
+
+# Lossless compression options for Secondary Capture pixel data, mapped to their transfer syntaxes
+COMPRESSION_NONE = "none"
+COMPRESSION_RLE = "rle"
+COMPRESSION_DEFLATE = "deflate"
+COMPRESSION_TRANSFER_SYNTAXES = {
+    COMPRESSION_NONE: ExplicitVRLittleEndian,
+    COMPRESSION_RLE: RLELossless,
+    COMPRESSION_DEFLATE: DeflatedExplicitVRLittleEndian,
+}
+
+
+class ConversionError(Exception):
+    """Error reported to the user; `title` is used as the dialog/CLI heading."""
+    title = "Erro de Conversão"
+
+
+class PdfConversionError(ConversionError):
+    title = "Erro na Conversão do PDF"
+
+
+class UnsupportedFileError(ConversionError):
+    title = "Tipo de Arquivo não Suportado"
+
+
+class NoImagesError(ConversionError):
+    title = "Nenhuma Imagem Encontrada"
+
+
+class PixelDataTooLargeError(ConversionError):
+    title = "Documento Grande Demais"
+
+
+class ImageTooLargeError(ConversionError):
+    title = "Imagem Grande Demais"
+
+
+class ConversionCancelled(ConversionError):
+    title = "Conversão Cancelada"
+
+
+@dataclass(frozen=True)
+class RenderPolicy:
+    """
+    How PDF pages are rasterized.
+
+    `max_page_pixels` caps the pixels of each page: larger pages (plans, posters) are rendered at
+    the highest DPI that fits, so a few oversized pages cannot dominate time and output size.
+    `grayscale` renders straight to 8-bit gray, for documents known to be monochrome. `threads`
+    is the number of page ranges rendered at once, each by its own Poppler process (default: the
+    conversion's encode_workers, at most the page window); it never exceeds the page window.
+    """
+    dpi: int = PDF_RENDER_DPI
+    max_page_pixels: int = None
+    grayscale: bool = False
+    threads: int = None
+
+    def page_dpi(self, width_pt, height_pt):
+        """DPI for a page of `width_pt` x `height_pt` points (1/72 inch) under the pixel budget."""
+        if not self.max_page_pixels or width_pt * height_pt * (self.dpi / 72) ** 2 <= self.max_page_pixels:
+            return self.dpi
+        return max(MIN_RENDER_DPI, int(72 * (self.max_page_pixels / (width_pt * height_pt)) ** 0.5))
+
+
+@dataclass
+class EncodeStats:
+    pixel_bytes: int = 0 # Uncompressed pixel data
+    encoded_bytes: int = 0 # Size of the files written (of the encoded Pixel Data when no file is written)
+    encode_seconds: float = 0.0 # Encode + write time, summed over all workers
+    measured: bool = True # False when some encoded sizes are unknown (Deflate only sent, deflated by the C-STORE encoder)
+
+    def add(self, other):
+        self.pixel_bytes += other.pixel_bytes
+        self.encoded_bytes += other.encoded_bytes
+        self.encode_seconds += other.encode_seconds
+        self.measured = self.measured and other.measured
+
+    @property
+    def compression_ratio(self):
+        """Pixel bytes per encoded byte, or 0.0 when the encoded size was not (fully) measured."""
+        return self.pixel_bytes / self.encoded_bytes if self.encoded_bytes and self.measured else 0.0
+
+    def describe_ratio(self):
+        return f"{self.compression_ratio:.1f}x" if self.measured else "não medida (enviado sem gravar arquivos)"
+
+
+@dataclass
+class ConversionResult:
+    source_path: str
+    output_dir: str
+    series_instance_uid: str
+    output_files: list = field(default_factory=list)
+    instance_count: int = 0
+    page_count: int = 0
+    stored_instances: int = 0 # Instances accepted by every C-STORE destination
+    elapsed: float = 0.0
+    encode_stats: EncodeStats = field(default_factory=EncodeStats)
+    timings: dict = None # StageTimings.as_dict() when instrumented
+
+
+def _no_progress(percent, message):
+    pass
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError: # Not available on Windows/macOS
+        return os.cpu_count() or 1
+
+
+def get_dicom_tag_or_default(ds, tag_name, default_value=""):
+    return ds.get(tag_name, default_value)
+
+
+def secondary_capture_filename(series_instance_uid, instance_number, prefix="SC"):
+    series_uid_short = series_instance_uid.split('.')[-1][:8]
+    return f"{prefix}_{series_uid_short}_{str(instance_number).zfill(3)}.dcm"
+
+
+def encapsulated_pdf_filename(series_instance_uid):
+    return secondary_capture_filename(series_instance_uid, 1, prefix="DOC")
+
+
+def _pdf_error(e):
+    return PdfConversionError(f"Não foi possível converter o PDF: {e}\nVerifique se o Poppler está instalado e no PATH do sistema.")
+
+
+def _render_pdf_window(pdf_path, first_page, last_page, dpi, grayscale=False, timings=NO_TIMINGS):
+    from pdf2image import convert_from_path # Only PDF conversions pay for pdf2image
+    try:
+        with timings.stage("rasterize"):
+            return convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page, grayscale=grayscale)
+    except Exception as e:
+        raise _pdf_error(e) from e
+
+
+def pdf_page_sizes(pdfinfo):
+    """Return {page number: (width_pt, height_pt)} from pdfinfo output run with -f/-l."""
+    sizes = {}
+    for key, value in pdfinfo.items():
+        words = key.split()
+        if words[0] != "Page" or words[-1] != "size":
+            continue
+        page = int(words[1]) if len(words) == 3 else 1 # A single-page range prints plain "Page size"
+        dimensions = value.split()
+        try:
+            sizes[page] = (float(dimensions[0]), float(dimensions[2])) # "612 x 792 pts (letter)"
+        except (IndexError, ValueError):
+            pass
+    return sizes
+
+
+def plan_pdf_windows(page_count, window, page_dpis):
+    """Split pages 1..page_count into (first, last, dpi) ranges of at most `window` pages rendered at one DPI."""
+    windows = []
+    for page in range(1, page_count + 1):
+        dpi = page_dpis[page - 1]
+        if windows and windows[-1][2] == dpi and page - windows[-1][0] < window:
+            windows[-1] = (windows[-1][0], page, dpi)
+        else:
+            windows.append((page, page, dpi))
+    return windows
+
+
+def iter_pdf_pages(pdf_path, page_count, policy=None, window=PDF_PAGE_WINDOW, timings=NO_TIMINGS, page_sizes=None):
+    """
+    Yield the pages of a PDF as PIL images, rendering a few pages at a time.
+
+    `policy.threads` page ranges (at most `window`) are rasterized at once, on background threads,
+    while the caller processes the current one; the `window` pages are split between them, so at
+    most `window` pages plus the current range are held in memory, whatever the page or core count. With a pixel budget,
+    `page_sizes` (see pdf_page_sizes) sets each page's DPI.
+    """
+    policy = policy or RenderPolicy()
+    threads = max(1, min(policy.threads or 1, window)) # More threads would hold more than `window` pages
+    page_dpis = [policy.page_dpi(*page_sizes[page]) if page_sizes and page in page_sizes else policy.dpi
+                 for page in range(1, page_count + 1)]
+    windows = iter(plan_pdf_windows(page_count, max(1, window // threads), page_dpis))
+    with ThreadPoolExecutor(max_workers=threads) as render_executor:
+        pending = deque()
+
+        def render_next():
+            next_window = next(windows, None)
+            if next_window is not None:
+                pending.append(render_executor.submit(_render_pdf_window, pdf_path, *next_window, policy.grayscale, timings))
+
+        for _ in range(threads): render_next()
+        try:
+            while pending:
+                pages = pending.popleft().result()
+                render_next()
+                # Pop pages so the window list releases each one once the caller is done with it
+                pages.reverse()
+                while pages:
+                    yield pages.pop()
+        finally:
+            for future in pending: future.cancel()
+
+
+def _open_image(image_path):
+    """Image.open() with unreadable files and Pillow's own size check reported as ConversionError."""
+    try:
+        return Image.open(image_path)
+    except Image.DecompressionBombError as e: # Only when Image.MAX_IMAGE_PIXELS was set back by someone else
+        raise ImageTooLargeError(f"A imagem '{os.path.basename(image_path)}' é grande demais: {e}") from e
+    except UnidentifiedImageError as e:
+        raise UnsupportedFileError(f"Não foi possível ler a imagem '{os.path.basename(image_path)}': "
+                                   "o arquivo está corrompido ou em um formato não suportado.") from e
+
+
+def _check_image_size(image, image_path):
+    """Raise ImageTooLargeError when the current frame of `image` is above MAX_IMAGE_PIXELS."""
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f"A imagem '{os.path.basename(image_path)}' tem {image.width}x{image.height} pixels "
+            f"({image.width * image.height / 1e6:.0f} MP), acima do limite de {MAX_IMAGE_PIXELS / 1e6:.0f} MP.")
+
+
+def _iter_image_frames(image_path, frame_count, reopen=True):
+    """
+    Yield each frame of a (multi-page) TIFF/GIF/image as its own PIL image, decoding one at a time.
+
+    With `reopen`, every frame is a separate Image.open() seeked to it, so the caller can close it
+    and nothing else holds its pixels. GIF frames build on the previous ones, so those are copied
+    from a single decoder instead.
+    """
+    if reopen:
+        for index in range(frame_count):
+            frame = _open_image(image_path)
+            if index: frame.seek(index)
+            try:
+                _check_image_size(frame, image_path)
+            except ImageTooLargeError:
+                frame.close()
+                raise
+            yield frame
+        return
+    with _open_image(image_path) as image:
+        for index in range(frame_count):
+            image.seek(index)
+            _check_image_size(image, image_path)
+            yield image.copy()
+
+
+def _remove_partial_series(output_files):
+    for filename in output_files:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+    output_files.clear()
+
+
+def open_source_pages(source_file_to_convert, pdf_page_window=PDF_PAGE_WINDOW, timings=NO_TIMINGS, render_policy=None):
+    """Return (page_count, page_iterator) for a PDF or image file without rendering it all up front."""
+    file_ext = os.path.splitext(source_file_to_convert)[1].lower()
+    if file_ext == ".pdf":
+        from pdf2image import pdfinfo_from_path # Only PDF conversions pay for pdf2image
+        render_policy = render_policy or RenderPolicy()
+        try:
+            if render_policy.max_page_pixels: # Per-page sizes are only listed for an explicit page range
+                pdfinfo = pdfinfo_from_path(source_file_to_convert, first_page=1, last_page=PDFINFO_LAST_PAGE)
+            else:
+                pdfinfo = pdfinfo_from_path(source_file_to_convert)
+        except Exception as e:
+            raise _pdf_error(e) from e
+        page_sizes = pdf_page_sizes(pdfinfo) if render_policy.max_page_pixels else None
+        return pdfinfo["Pages"], iter_pdf_pages(source_file_to_convert, pdfinfo["Pages"], render_policy, pdf_page_window,
+                                                timings, page_sizes)
+    if file_ext in IMAGE_EXTENSIONS:
+        with _open_image(source_file_to_convert) as image:
+            _check_image_size(image, source_file_to_convert)
+            frame_count = getattr(image, "n_frames", 1)
+            reopen = image.format != "GIF"
+        return frame_count, _iter_image_frames(source_file_to_convert, frame_count, reopen)
+    raise UnsupportedFileError(f"O tipo de arquivo '{file_ext}' não é suportado para conversão.")
+
+
+def _new_instance_dataset(sop_class_uid):
+    ds = Dataset()
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+
+    # --- File Meta Information (Group 0002 Tags ONLY) ---
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = sop_class_uid
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid() # Unique SOP Instance UID for this instance
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.ImplementationClassUID = PYDICOM_IMPLEMENTATION_UID
+    ds.file_meta.ImplementationVersionName = "PYDICOM " + pydicom.__version__
+
+    # --- Main Dataset Tags ---
+    ds.SpecificCharacterSet = "ISO_IR 100" # For the main dataset
+    return ds
+
+
+def _copy_patient_and_study(ds, source_ds_template, study_instance_uid, source_name, current_date, current_time):
+    # Patient Module
+    ds.PatientName = get_dicom_tag_or_default(source_ds_template, "PatientName", "UNKNOWN")
+    ds.PatientID = get_dicom_tag_or_default(source_ds_template, "PatientID", "UNKNOWN")
+    ds.PatientBirthDate = get_dicom_tag_or_default(source_ds_template, "PatientBirthDate", "")
+    ds.PatientSex = get_dicom_tag_or_default(source_ds_template, "PatientSex", "")
+
+    # General Study Module
+    ds.StudyInstanceUID = study_instance_uid
+    ds.StudyDate = get_dicom_tag_or_default(source_ds_template, "StudyDate", current_date)
+    ds.StudyTime = get_dicom_tag_or_default(source_ds_template, "StudyTime", current_time)
+    ds.ReferringPhysicianName = get_dicom_tag_or_default(source_ds_template, "ReferringPhysicianName", "")
+    ds.StudyID = get_dicom_tag_or_default(source_ds_template, "StudyID", "1")
+    ds.AccessionNumber = get_dicom_tag_or_default(source_ds_template, "AccessionNumber", "")
+    original_study_desc = get_dicom_tag_or_default(source_ds_template, "StudyDescription", "SecondaryCapture")
+    ds.StudyDescription = (original_study_desc + f" - Converted {source_name}")[:64]
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _read_template(path, mtime_ns, size):
+    return pydicom.dcmread(path, force=True, stop_before_pixels=True, specific_tags=TEMPLATE_TAGS)
+
+
+def load_template(source_dcm_path):
+    """
+    Return the template DICOM's TEMPLATE_TAGS, parsed once per path + mtime + size.
+
+    Pixel data and every other element are skipped, so large CT/MR templates load quickly. The
+    dataset is shared between callers and must not be modified.
+    """
+    path = os.path.abspath(source_dcm_path)
+    stat = os.stat(path)
+    return _read_template(path, stat.st_mtime_ns, stat.st_size)
+
+
+def build_series_skeleton(source_ds_template, *, study_instance_uid, series_instance_uid, source_name,
+                          current_date, current_time):
+    """
+    Build the attributes shared by every Secondary Capture instance of a run, once per series.
+
+    Per-instance attributes (SOP Instance UID, Instance Number, description and the variable part
+    of the pixel module) are never part of the skeleton, so _secondary_capture_header can share its
+    elements between instances without copying them.
+    """
+    ds = Dataset()
+    _copy_patient_and_study(ds, source_ds_template, study_instance_uid, source_name, current_date, current_time)
+
+    # General Series Module
+    ds.SeriesInstanceUID = series_instance_uid
+    ds.SeriesNumber = str(get_dicom_tag_or_default(source_ds_template, "SeriesNumber", "999"))
+    ds.Modality = "OT" # Other
+    ds.SeriesDate = current_date
+    ds.SeriesTime = current_time
+    ds.Laterality = get_dicom_tag_or_default(source_ds_template, "Laterality", "")
+
+    # Image dates
+    ds.ContentDate = current_date
+    ds.ContentTime = current_time
+    ds.AcquisitionDateTime = current_date + current_time # SC usually current datetime
+
+    # Image Pixel Module (constant part)
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0 # Unsigned
+
+    # Secondary Capture Image Module
+    ds.ConversionType = "WSD" # Workstation
+    ds.DateOfSecondaryCapture = current_date
+    ds.TimeOfSecondaryCapture = current_time
+
+    return ds
+
+
+def write_instance(ds, output_filename, transfer_syntax=ExplicitVRLittleEndian, return_dataset=False):
+    """
+    Encode `ds` with `transfer_syntax` and write it; runs in InstanceWriter's worker processes.
+
+    With `output_filename` None the dataset is only encoded; a Deflate dataset is then deflated by
+    whoever writes or sends it, so its encoded size is left unmeasured. Returns EncodeStats, or
+    (EncodeStats, encoded dataset) with `return_dataset` so it can be sent over the network.
+    """
+    start_time = time.perf_counter()
+    pixel_bytes = len(ds.PixelData) if "PixelData" in ds else 0
+    if transfer_syntax == RLELossless:
+        ds.compress(RLELossless, encoding_plugin=RLE_ENCODING_PLUGIN) # Encapsulates PixelData and updates the file meta TransferSyntaxUID
+    else:
+        ds.file_meta.TransferSyntaxUID = transfer_syntax # Deflate is applied by dcmwrite (or by the C-STORE encoder)
+    measured = True
+    if output_filename is not None:
+        pydicom.dcmwrite(output_filename, ds, write_like_original=False)
+        encoded_bytes = os.path.getsize(output_filename)
+    elif transfer_syntax == DeflatedExplicitVRLittleEndian:
+        encoded_bytes, measured = 0, False
+    else:
+        encoded_bytes = len(ds.PixelData) if "PixelData" in ds else 0
+    stats = EncodeStats(pixel_bytes, encoded_bytes, time.perf_counter() - start_time, measured)
+    return (stats, ds) if return_dataset else stats
+
+
+class InstanceWriter:
+    """
+    Writes the instances of one series with the chosen transfer syntax.
+
+    Compressed instances are encoded and written on a process pool, keeping up to two pages per
+    worker, and never more than `max_in_flight` raw pages, in flight, so compression overlaps
+    rendering of the following pages without memory growing with the core count. The pool has no
+    more processes than that cap, since extra ones would never get a page. Uncompressed instances
+    (or a single worker) are written inline.
+
+    With a `store` sink (store.StoreSink) every encoded instance is also sent from memory, in
+    instance order; with `write_files` False it is only sent. An `executor` shared across series
+    (see server.py) replaces the per-series pool and is left running.
+    """
+
+    def __init__(self, transfer_syntax=ExplicitVRLittleEndian, workers=1, store=None, write_files=True, executor=None,
+                 max_in_flight=PDF_PAGE_WINDOW):
+        self.transfer_syntax = transfer_syntax
+        self.store = store
+        self.write_files = write_files
+        self.stats = EncodeStats()
+        self.output_files = []
+        self.instance_count = 0
+        self._pending = deque()
+        self._max_in_flight = max(1, min(workers * 2, max_in_flight))
+        use_pool = transfer_syntax != ExplicitVRLittleEndian and workers > 1
+        self._owns_executor = executor is None
+        self._executor = (executor or ProcessPoolExecutor(max_workers=min(workers, self._max_in_flight))) if use_pool else None
+
+    def write(self, ds, output_filename, strips=None):
+        """Queue `ds` for writing; with `strips` (see image_pixel_strips) `ds` has no Pixel Data and is streamed."""
+        if strips is not None:
+            self._write_strips(ds, output_filename, strips)
+            return
+        self.instance_count += 1
+        if self.write_files:
+            self.output_files.append(output_filename)
+        else:
+            output_filename = None
+        args = (ds, output_filename, self.transfer_syntax, self.store is not None)
+        if self._executor is None:
+            self._collect(write_instance(*args))
+            return
+        self._pending.append(self._executor.submit(write_instance, *args))
+        while len(self._pending) >= self._max_in_flight:
+            self._collect(self._pending.popleft().result())
+
+    def _write_strips(self, ds, output_filename, strips):
+        self.flush() # Keeps the instances in order for the store
+        self.instance_count += 1
+        if self.write_files:
+            self.output_files.append(output_filename)
+        else:
+            fd, output_filename = tempfile.mkstemp(suffix=".dcm", dir=os.path.dirname(output_filename) or None)
+            os.close(fd)
+        start_time = time.perf_counter()
+        pixel_bytes = write_strips(ds, output_filename, strips, self.transfer_syntax)
+        self.stats.add(EncodeStats(pixel_bytes, os.path.getsize(output_filename), time.perf_counter() - start_time))
+        if self.store is None:
+            return
+        self.store.send(output_filename) # Sent from disk: the full pixel data never exists in memory
+        if not self.write_files:
+            try:
+                self.store.flush()
+            finally:
+                os.remove(output_filename)
+
+    def _collect(self, written):
+        if self.store is None:
+            self.stats.add(written)
+            return
+        stats, encoded_ds = written
+        self.stats.add(stats)
+        self.store.send(encoded_ds)
+
+    def flush(self):
+        while self._pending:
+            self._collect(self._pending.popleft().result())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None: self.flush()
+        finally:
+            if self._executor is not None:
+                for future in self._pending: future.cancel()
+                if self._owns_executor: self._executor.shutdown(wait=True)
+                else: wait(self._pending) # Encodes already running still write their files
+
+
+def _channels_identical(rgb):
+    probe = rgb[::GRAYSCALE_PROBE_STEP, ::GRAYSCALE_PROBE_STEP]
+    if not (np.array_equal(probe[..., 0], probe[..., 1]) and np.array_equal(probe[..., 1], probe[..., 2])):
+        return False
+    return np.array_equal(rgb[..., 0], rgb[..., 1]) and np.array_equal(rgb[..., 1], rgb[..., 2])
+
+
+def _is_near_bilevel(histogram, pixel_count):
+    near_black_or_white = histogram[:BILEVEL_TOLERANCE + 1].sum() + histogram[255 - BILEVEL_TOLERANCE:].sum()
+    return near_black_or_white >= BILEVEL_MIN_FRACTION * pixel_count
+
+
+def _snap_to_bilevel(gray):
+    return (gray >= 128).view(np.uint8) * np.uint8(255)
+
+
+def _snap_if_bilevel(gray):
+    if not _is_near_bilevel(np.bincount(gray.ravel(), minlength=256), gray.size):
+        return gray
+    return _snap_to_bilevel(gray)
+
+
+def image_pixel_data(pil_image, detect_grayscale=True, bilevel=False):
+    """
+    Return (pixel_bytes, samples_per_pixel, photometric_interpretation) for an 8-bit image.
+
+    RGB pages whose three channels are identical are stored as MONOCHROME2 with one sample per
+    pixel. The check runs on a NumPy view of the tobytes() buffer, so color pages are stored from
+    that buffer without further copies. With `bilevel`, grayscale pages that are nearly pure black
+    and white are snapped to 0/255, which RLE and Deflate compress far better.
+    """
+    if pil_image.mode in ('L', 'LA'): # LA: Grayscale with Alpha
+        if pil_image.mode == 'LA': pil_image = pil_image.convert('L')
+        if not bilevel:
+            return pil_image.tobytes(), 1, "MONOCHROME2"
+        gray = np.frombuffer(pil_image.tobytes(), dtype=np.uint8)
+    else:
+        if pil_image.mode != 'RGB': pil_image = pil_image.convert('RGB') # RGBA, Palette, CMYK, etc.
+        pixel_bytes = pil_image.tobytes()
+        if not detect_grayscale:
+            return pixel_bytes, 3, "RGB"
+        rgb = np.frombuffer(pixel_bytes, dtype=np.uint8).reshape(pil_image.height, pil_image.width, 3)
+        if not _channels_identical(rgb):
+            return pixel_bytes, 3, "RGB"
+        gray = rgb[..., 0]
+    if bilevel: gray = _snap_if_bilevel(gray)
+    return gray.tobytes(), 1, "MONOCHROME2"
+
+
+def is_large_image(pil_image):
+    return pil_image.width * pil_image.height > LARGE_IMAGE_PIXELS
+
+
+def _iter_row_strips(pil_image, rows_per_strip):
+    for top in range(0, pil_image.height, rows_per_strip):
+        yield pil_image.crop((0, top, pil_image.width, min(top + rows_per_strip, pil_image.height)))
+
+
+def _strip_gray(strip, check_channels=True):
+    """Return the strip as a 2-D uint8 array, or None when it is color (RGB channels differ)."""
+    if strip.mode in ('L', 'LA'):
+        if strip.mode == 'LA': strip = strip.convert('L')
+        return np.frombuffer(strip.tobytes(), dtype=np.uint8).reshape(strip.height, strip.width)
+    if strip.mode != 'RGB': strip = strip.convert('RGB')
+    rgb = np.frombuffer(strip.tobytes(), dtype=np.uint8).reshape(strip.height, strip.width, 3)
+    if check_channels and not _channels_identical(rgb):
+        return None
+    return rgb[..., 0]
+
+
+def image_pixel_strips(pil_image, detect_grayscale=True, bilevel=False):
+    """
+    Strip-wise counterpart of image_pixel_data, for images above LARGE_IMAGE_PIXELS.
+
+    Returns (strips, samples_per_pixel, photometric_interpretation), where `strips` is a generator
+    of (strip_bytes, strip_rows) that converts one band of rows at a time. The grayscale and
+    bilevel decisions are made in a first pass over the bands, so besides the decoded image only
+    one band is held in memory at a time.
+    """
+    rows_per_strip = max(1, STRIP_PIXELS // pil_image.width)
+    source_is_gray = pil_image.mode in ('L', 'LA')
+    gray_output = source_is_gray or detect_grayscale
+    histogram = np.zeros(256, dtype=np.int64)
+    if gray_output and (bilevel or not source_is_gray):
+        for strip in _iter_row_strips(pil_image, rows_per_strip):
+            gray = _strip_gray(strip)
+            if gray is None:
+                gray_output = False
+                break
+            if bilevel: histogram += np.bincount(gray.ravel(), minlength=256)
+    snap = bilevel and gray_output and _is_near_bilevel(histogram, pil_image.width * pil_image.height)
+
+    def strips():
+        for strip in _iter_row_strips(pil_image, rows_per_strip):
+            if not gray_output:
+                yield (strip if strip.mode == 'RGB' else strip.convert('RGB')).tobytes(), strip.height
+                continue
+            gray = _strip_gray(strip, check_channels=False)
+            yield (_snap_to_bilevel(gray) if snap else gray).tobytes(), strip.height
+
+    return strips(), (1 if gray_output else 3), ("MONOCHROME2" if gray_output else "RGB")
+
+
+def _secondary_capture_header(sop_class_uid, series_skeleton, *, instance_number, series_desc, rows, columns,
+                              samples_per_pixel):
+    """Build every Secondary Capture attribute except Pixel Data on top of the series skeleton."""
+    ds = _new_instance_dataset(sop_class_uid)
+    ds.update(series_skeleton)
+    ds.SeriesDescription = series_desc[:64]
+
+    # SOP Common Module
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID # Match File Meta
+    ds.InstanceNumber = str(instance_number)
+
+    # Image Pixel Module
+    ds.SamplesPerPixel = samples_per_pixel
+    ds.PhotometricInterpretation = "RGB" if samples_per_pixel == 3 else "MONOCHROME2"
+    ds.Rows = rows
+    ds.Columns = columns
+
+    if ds.SamplesPerPixel == 3: ds.PlanarConfiguration = 0 # Pixel-interleaved
+    if ds.PhotometricInterpretation == "MONOCHROME2": ds.PresentationLUTShape = "IDENTITY"
+
+    return ds
+
+
+def build_secondary_capture(series_skeleton, pil_image, *, instance_number, series_desc, detect_grayscale=True,
+                            bilevel=False, timings=NO_TIMINGS):
+    """Build one Secondary Capture dataset for `pil_image` from the series skeleton."""
+    with timings.stage("pixels"):
+        pixel_bytes, samples_per_pixel, _ = image_pixel_data(pil_image, detect_grayscale, bilevel)
+    with timings.stage("dataset"):
+        ds = _secondary_capture_header(SECONDARY_CAPTURE_SOP_CLASS_UID, series_skeleton, instance_number=instance_number,
+                                       series_desc=series_desc, rows=pil_image.height, columns=pil_image.width,
+                                       samples_per_pixel=samples_per_pixel)
+        ds.PixelData = pixel_bytes
+    return ds
+
+
+def build_large_secondary_capture(series_skeleton, pil_image, *, instance_number, series_desc, detect_grayscale=True,
+                                  bilevel=False, timings=NO_TIMINGS):
+    """Like build_secondary_capture for a large image: returns (dataset without Pixel Data, pixel strips)."""
+    with timings.stage("pixels"):
+        strips, samples_per_pixel, _ = image_pixel_strips(pil_image, detect_grayscale, bilevel)
+    with timings.stage("dataset"):
+        ds = _secondary_capture_header(SECONDARY_CAPTURE_SOP_CLASS_UID, series_skeleton, instance_number=instance_number,
+                                       series_desc=series_desc, rows=pil_image.height, columns=pil_image.width,
+                                       samples_per_pixel=samples_per_pixel)
+    return ds, strips
+
+
+def build_multiframe_secondary_capture(series_skeleton, *, frame_count, rows, columns, samples_per_pixel, series_desc):
+    """
+    Build the header of a Multi-frame Grayscale Byte or True Color SC instance, without Pixel Data.
+
+    Frames are indexed by page through PageNumberVector; multiframe.write_multiframe streams the
+    pixel data after these attributes.
+    """
+    sop_class_uid = MULTIFRAME_TRUE_COLOR_SC_SOP_CLASS_UID if samples_per_pixel == 3 else MULTIFRAME_GRAYSCALE_BYTE_SC_SOP_CLASS_UID
+    ds = _secondary_capture_header(sop_class_uid, series_skeleton, instance_number=1, series_desc=series_desc,
+                                   rows=rows, columns=columns, samples_per_pixel=samples_per_pixel)
+
+    # Multi-frame & SC Multi-frame Image Modules
+    ds.NumberOfFrames = str(frame_count)
+    ds.FrameIncrementPointer = 0x00182001 # Page Number Vector
+    ds.PageNumberVector = [str(page) for page in range(1, frame_count + 1)]
+    ds.BurnedInAnnotation = "YES"
+    if ds.PhotometricInterpretation == "MONOCHROME2":
+        ds.RescaleIntercept = "0"; ds.RescaleSlope = "1"; ds.RescaleType = "US"
+
+    return ds
+
+
+def build_encapsulated_pdf(source_ds_template, pdf_bytes, *, study_instance_uid, series_instance_uid,
+                           source_name, current_date, current_time):
+    """Build an Encapsulated PDF instance holding `pdf_bytes` unchanged, with the template's patient/study tags."""
+    ds = _new_instance_dataset(ENCAPSULATED_PDF_SOP_CLASS_UID)
+    _copy_patient_and_study(ds, source_ds_template, study_instance_uid, source_name, current_date, current_time)
+
+    # Encapsulated Document Series Module
+    ds.SeriesInstanceUID = series_instance_uid
+    ds.SeriesNumber = str(get_dicom_tag_or_default(source_ds_template, "SeriesNumber", "999"))
+    ds.Modality = "DOC" # Document
+    ds.SeriesDate = current_date
+    ds.SeriesTime = current_time
+    ds.SeriesDescription = f"Converted {source_name}"[:64]
+
+    # General Equipment & SC Equipment Modules
+    ds.Manufacturer = ""
+    ds.ConversionType = "WSD" # Workstation
+
+    # SOP Common Module
+    ds.SOPClassUID = ENCAPSULATED_PDF_SOP_CLASS_UID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID # Match File Meta
+
+    # Encapsulated Document Module
+    ds.InstanceNumber = "1"
+    ds.ContentDate = current_date
+    ds.ContentTime = current_time
+    ds.AcquisitionDateTime = current_date + current_time
+    ds.BurnedInAnnotation = "YES" # A scanned report carries patient identification in its content
+    ds.DocumentTitle = os.path.splitext(source_name)[0][:64]
+    ds.ConceptNameCodeSequence = []
+    ds.MIMETypeOfEncapsulatedDocument = "application/pdf"
+    ds.EncapsulatedDocumentLength = len(pdf_bytes)
+    ds.EncapsulatedDocument = pdf_bytes # pydicom pads odd lengths with a trailing null byte
+
+    return ds
+
+
+def convert_file(source_dcm_path, source_file_to_convert, output_dir=None, progress=None, pdf_page_window=PDF_PAGE_WINDOW,
+                 cancel_event=None, output_mode=OUTPUT_MODE_RASTER, compression=COMPRESSION_NONE, encode_workers=None,
+                 detect_grayscale=True, bilevel=False, multiframe=False, store_destinations=None, write_files=True,
+                 instrument=False, trace_memory=False, render_policy=None, encode_executor=None):
+    """
+    Convert a PDF or image into a new Secondary Capture series.
+
+    The series is written to `output_dir` (defaults to the source file's folder; created if
+    missing). `progress`, if given, is called as progress(percent, message) between stages. PDF
+    pages are rendered, written and released `pdf_page_window` pages at a time, so memory does not
+    grow with the page count; it also caps the pages queued for encoding, and so the encode
+    processes actually used (min(encode_workers, pdf_page_window)).
+    `render_policy` (RenderPolicy) sets the DPI, per-page pixel budget, grayscale rendering and
+    parallel render threads.
+
+    By default every page becomes its own instance. With `multiframe`, all pages are written as the
+    frames of a single Multi-frame SC instance, padded to the largest page size. With
+    output_mode=OUTPUT_MODE_ENCAPSULATED_PDF a PDF source is instead stored as a single
+    Encapsulated PDF instance, without rasterizing it (Poppler is not needed).
+
+    `compression` selects the transfer syntax of the Secondary Capture files (see
+    COMPRESSION_TRANSFER_SYNTAXES); compressed pages are encoded on `encode_workers` processes
+    (default: one per available core), or on `encode_executor`, a process pool kept alive across
+    conversions by the caller (see server.py). The sizes and encode time end up in result.encode_stats.
+    `detect_grayscale` and `bilevel` are passed to image_pixel_data for every page.
+
+    With `store_destinations` (store.StoreDestination list) every instance is also sent from memory
+    with C-STORE over one association per destination; `write_files` False skips the files on disk.
+
+    With `instrument`, the time spent in each stage is recorded in result.timings (see
+    instrumentation.StageTimings); `trace_memory` also records the tracemalloc peak, at some cost.
+
+    If `cancel_event` (a threading.Event) is set, the conversion stops before the next page, removes
+    the files already written for the series and raises ConversionCancelled. Other ConversionError
+    subclasses report problems the user can fix; FileNotFoundError / InvalidDicomError come from
+    the inputs.
+    """
+    start_time = time.perf_counter()
+    report = progress or _no_progress
+    if output_dir is None:
+        output_dir = os.path.dirname(source_file_to_convert)
+    source_name = os.path.basename(source_file_to_convert)
+    file_ext = os.path.splitext(source_file_to_convert)[1].lower()
+    if not write_files and not store_destinations:
+        raise ConversionError("Sem gravar arquivos, é preciso informar ao menos um destino DICOM para envio.")
+    if compression not in COMPRESSION_TRANSFER_SYNTAXES:
+        raise ConversionError(f"Compressão desconhecida '{compression}'; use {', '.join(COMPRESSION_TRANSFER_SYNTAXES)}.")
+    if output_mode not in OUTPUT_MODES:
+        raise ConversionError(f"Modo de saída desconhecido '{output_mode}'; use {', '.join(OUTPUT_MODES)}.")
+    if output_dir: os.makedirs(output_dir, exist_ok=True) # batch -o / manifest output_dir may not exist yet
+
+    def check_cancelled(writer=None):
+        if cancel_event is not None and cancel_event.is_set():
+            if writer is not None:
+                writer.flush() # Let in-flight pages land before removing them
+                _remove_partial_series(writer.output_files)
+            message = "A conversão foi cancelada e os arquivos parciais foram removidos."
+            if store_destinations: message += " As instâncias já enviadas permanecem nos destinos."
+            raise ConversionCancelled(message)
+
+    transfer_syntax = COMPRESSION_TRANSFER_SYNTAXES[compression]
+    timings = StageTimings(trace_memory) if instrument or trace_memory else NO_TIMINGS
+    with timings, _open_store(store_destinations, transfer_syntax) as store:
+        check_cancelled()
+        report(5, "Lendo modelo de DICOM de origem...")
+        with timings.stage("template"):
+            source_ds_template = load_template(source_dcm_path)
+
+        new_series_instance_uid = generate_uid()
+        result = ConversionResult(source_file_to_convert, output_dir, new_series_instance_uid)
+
+        current_date = datetime.date.today().strftime("%Y%m%d")
+        current_time = datetime.datetime.now().strftime("%H%M%S.%f")[:13]
+
+        if output_mode == OUTPUT_MODE_ENCAPSULATED_PDF and file_ext == ".pdf":
+            report(15, f"Lendo {source_name}...")
+            with timings.stage("read_source"), open(source_file_to_convert, "rb") as f:
+                pdf_bytes = f.read()
+            report(60, "Encapsulando PDF...")
+            with timings.stage("dataset"):
+                ds = build_encapsulated_pdf(
+                    source_ds_template, pdf_bytes,
+                    study_instance_uid=source_ds_template.StudyInstanceUID,
+                    series_instance_uid=new_series_instance_uid,
+                    source_name=source_name,
+                    current_date=current_date,
+                    current_time=current_time,
+                )
+            with timings.stage("write"), InstanceWriter(store=store, write_files=write_files) as writer:
+                writer.write(ds, os.path.join(output_dir, encapsulated_pdf_filename(new_series_instance_uid)))
+            total_images, instance_count = 1, 1
+            output_files, encode_stats = writer.output_files, writer.stats
+            summary = "PDF encapsulado em 1 instância DICOM"
+        else:
+            report(15, f"Carregando {source_name}...")
+            render_policy = render_policy or RenderPolicy()
+            if render_policy.threads is None:
+                render_policy = replace(render_policy, threads=min(encode_workers or available_cores(), pdf_page_window))
+            with timings.stage("open_source"):
+                total_images, images_to_convert = open_source_pages(source_file_to_convert, pdf_page_window, timings,
+                                                                    render_policy)
+            if not total_images:
+                raise NoImagesError("Nenhuma imagem foi encontrada no arquivo de origem selecionado.")
+            # Time spent waiting for the next page (PDF rendering that did not overlap the writes)
+            pages = timed_iter(images_to_convert, timings, "page_wait") if timings.enabled else images_to_convert
+
+            encode_workers = min(encode_workers or available_cores(), total_images)
+            series_skeleton = build_series_skeleton(
+                source_ds_template,
+                study_instance_uid=source_ds_template.StudyInstanceUID,
+                series_instance_uid=new_series_instance_uid,
+                source_name=source_name,
+                current_date=current_date,
+                current_time=current_time,
+            )
+            try:
+                if multiframe:
+                    output_files, encode_stats = _write_multiframe_instance(
+                        series_skeleton, pages, total_images, f"Converted {source_name}",
+                        os.path.join(output_dir, secondary_capture_filename(new_series_instance_uid, 1)),
+                        transfer_syntax, encode_workers, detect_grayscale, bilevel, report, check_cancelled,
+                        store, write_files, timings, encode_executor, pdf_page_window,
+                    )
+                    instance_count = 1
+                else:
+                    with InstanceWriter(transfer_syntax, encode_workers, store, write_files, encode_executor,
+                                        pdf_page_window) as writer:
+                        for i, pil_image in enumerate(pages):
+                            check_cancelled(writer)
+                            report(20 + int(((i + 1) / total_images) * 75), f"Processando imagem {i+1} de {total_images}...")
+
+                            series_desc = f"Converted {source_name}"
+                            if total_images > 1: series_desc += f" - Page {i+1}"
+                            page_options = dict(instance_number=i + 1, series_desc=series_desc, detect_grayscale=detect_grayscale,
+                                                bilevel=bilevel, timings=timings)
+                            if is_large_image(pil_image):
+                                ds, strips = build_large_secondary_capture(series_skeleton, pil_image, **page_options)
+                            else:
+                                ds, strips = build_secondary_capture(series_skeleton, pil_image, **page_options), None
+
+                            output_filename = os.path.join(output_dir, secondary_capture_filename(new_series_instance_uid, i + 1))
+                            with timings.stage("write"): # Encode + write, or waiting for the encode pool
+                                writer.write(ds, output_filename, strips)
+                            pil_image.close(); del ds, strips, pil_image # Free this page before the next one is taken
+                        with timings.stage("write"):
+                            writer.flush()
+                    output_files, instance_count, encode_stats = writer.output_files, writer.instance_count, writer.stats
+            finally:
+                images_to_convert.close() # Stops any background PDF rendering still in flight
+            summary = f"{total_images} página(s) em {instance_count} instância(s) DICOM"
+
+        if store is not None:
+            report(97, "Enviando para os destinos DICOM...")
+            with timings.stage("store"):
+                store.flush()
+            result.stored_instances = store.sent
+
+    result.output_files = output_files
+    result.instance_count = instance_count
+    result.page_count = total_images
+    result.encode_stats = encode_stats
+    result.elapsed = time.perf_counter() - start_time
+    if timings.enabled: result.timings = timings.as_dict()
+    summary = f"Conversão bem-sucedida! {summary} {_destination_summary(result, store_destinations)}."
+    if compression != COMPRESSION_NONE and encode_stats.pixel_bytes:
+        summary += f" Compressão {encode_stats.describe_ratio()} em {encode_stats.encode_seconds:.2f} s de codificação."
+    report(100, summary)
+    return result
+
+
+def _open_store(store_destinations, transfer_syntax):
+    """Return a store.StoreSink for `store_destinations`, or a context yielding None without destinations."""
+    if not store_destinations:
+        return contextlib.nullcontext()
+    from store import StoreSink # pynetdicom is optional and only imported when sending
+    return StoreSink(store_destinations, transfer_syntax)
+
+
+def _destination_summary(result, store_destinations):
+    places = [f"salva(s) em {result.output_dir}"] if result.output_files else []
+    if store_destinations:
+        places.append(f"enviada(s) para {', '.join(str(d) for d in store_destinations)}")
+    return " e ".join(places)
+
+
+def _check_pixel_data_length(spool, pil_image, samples_per_pixel, transfer_syntax, page_index):
+    """Fail before spooling page `page_index` when native Pixel Data with it would pass the 4 GiB element limit."""
+    if transfer_syntax == RLELossless: # One encapsulated fragment per frame, each far below the limit
+        return
+    length = spool.pixel_data_length((pil_image.height, pil_image.width, samples_per_pixel))
+    if length + length % 2 > MAX_PIXEL_DATA_LENGTH:
+        raise PixelDataTooLargeError(
+            f"Com a página {page_index + 1}, os pixels da instância multi-frame somariam {length / 2**30:.1f} GiB, "
+            "acima do limite de 4 GiB do DICOM sem compressão ou com Deflate. "
+            "Use a compressão RLE ou grave uma instância por página.")
+
+
+def _write_multiframe_instance(series_skeleton, images_to_convert, total_images, series_desc, output_filename,
+                               transfer_syntax, encode_workers, detect_grayscale, bilevel, report, check_cancelled,
+                               store=None, write_files=True, timings=NO_TIMINGS, encode_executor=None,
+                               max_in_flight=PDF_PAGE_WINDOW):
+    """
+    Spool every page to disk, then write them as the frames of one multi-frame instance.
+
+    The instance is always streamed to a file, which is sent from disk when there is a `store`
+    sink; without `write_files` it is a temporary file removed once every destination has it.
+    Returns (output_files, encode_stats) like the single-frame path.
+    """
+    with FrameSpool(os.path.dirname(output_filename)) as spool:
+        for i, pil_image in enumerate(images_to_convert):
+            check_cancelled()
+            report(20 + int(((i + 1) / total_images) * 65), f"Processando imagem {i+1} de {total_images}...")
+            if is_large_image(pil_image):
+                with timings.stage("pixels"):
+                    strips, samples_per_pixel, _ = image_pixel_strips(pil_image, detect_grayscale, bilevel)
+                _check_pixel_data_length(spool, pil_image, samples_per_pixel, transfer_syntax, i)
+                with timings.stage("spool"):
+                    spool.add_frame_strips(strips, pil_image.height, pil_image.width, samples_per_pixel)
+                pil_image.close(); del strips, pil_image
+                continue
+            with timings.stage("pixels"):
+                pixel_bytes, samples_per_pixel, _ = image_pixel_data(pil_image, detect_grayscale, bilevel)
+            _check_pixel_data_length(spool, pil_image, samples_per_pixel, transfer_syntax, i)
+            with timings.stage("spool"):
+                spool.add_frame(pixel_bytes, pil_image.height, pil_image.width, samples_per_pixel)
+            pil_image.close(); del pixel_bytes, pil_image
+
+        check_cancelled()
+        report(90, f"Gravando {len(spool.frames)} quadro(s) em um único arquivo DICOM...")
+        ds = build_multiframe_secondary_capture(
+            series_skeleton,
+            frame_count=len(spool.frames),
+            rows=spool.rows,
+            columns=spool.columns,
+            samples_per_pixel=spool.samples_per_pixel,
+            series_desc=series_desc,
+        )
+        if not write_files:
+            fd, output_filename = tempfile.mkstemp(suffix=".dcm", dir=os.path.dirname(output_filename) or None)
+            os.close(fd)
+        start_time = time.perf_counter()
+        with timings.stage("write"):
+            pixel_bytes = write_multiframe(ds, output_filename, spool, transfer_syntax, encode_workers, encode_executor,
+                                           max_in_flight)
+
+    encode_stats = EncodeStats(pixel_bytes, os.path.getsize(output_filename), time.perf_counter() - start_time)
+    if store is not None:
+        store.send(output_filename)
+    if write_files:
+        return [output_filename], encode_stats
+    try:
+        report(95, "Enviando para os destinos DICOM...")
+        with timings.stage("store"):
+            store.flush()
+    finally:
+        os.remove(output_filename)
+    return [], encode_stats
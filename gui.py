@@ -0,0 +1,354 @@
+"""
+Interface Gráfica
+
+Janela Tkinter do conversor: seleção do DICOM de origem e do arquivo a converter, opções de saída,
+fila de conversões e progresso. O Tk só é importado quando a interface é aberta (`main.py` sem
+argumentos), de modo que os modos de linha de comando e o servidor não pagam por ele.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+import pydicom
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import os
+import queue
+import threading
+import traceback # For detailed error logging if needed
+
+from converter import (ConversionCancelled, ConversionError, convert_file, load_template, OUTPUT_MODE_RASTER,
+                       OUTPUT_MODE_ENCAPSULATED_PDF, COMPRESSION_NONE, COMPRESSION_RLE, COMPRESSION_DEFLATE)
+
+EVENT_POLL_INTERVAL_MS = 100
+COMPRESSION_CHOICES = {
+    "Sem compressão": COMPRESSION_NONE,
+    "RLE Lossless": COMPRESSION_RLE,
+    "Deflate (Explicit VR Little Endian)": COMPRESSION_DEFLATE,
+}
+
+
+@dataclass
+class GuiConversionJob:
+    source_dcm_path: str
+    source_file_to_convert: str
+    output_dir: str
+    output_mode: str = OUTPUT_MODE_RASTER
+    compression: str = COMPRESSION_NONE
+    bilevel: bool = False
+    multiframe: bool = False
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+
+class DicomConverterApp:
+    def __init__(self, master):
+        self.master = master
+        master.title("Conversor DICOM de PDF/Imagem")
+        master.geometry("700x650")
+
+        self.source_dicom_path = tk.StringVar()
+        self.source_file_path = tk.StringVar() # PDF or Image
+        # We'll use source file directory as output directory
+        self.output_folder_path = tk.StringVar()
+
+        self.study_instance_uid = tk.StringVar(value="N/A")
+        self.patient_name = tk.StringVar(value="N/A")
+        self.patient_id = tk.StringVar(value="N/A")
+        self.study_date = tk.StringVar(value="N/A")
+        self.study_description = tk.StringVar(value="N/A")
+        self.encapsulate_pdf = tk.BooleanVar(value=False)
+        self.compression_choice = tk.StringVar(value="Sem compressão")
+        self.bilevel = tk.BooleanVar(value=False)
+        self.multiframe = tk.BooleanVar(value=False)
+
+        # Conversions run one at a time on a worker thread, in the order they were queued. The worker
+        # never touches Tk: it posts events that the Tk loop drains in _poll_events.
+        self.conversion_executor = ThreadPoolExecutor(max_workers=1)
+        self.conversion_events = queue.Queue()
+        self.pending_jobs = []
+        self.current_job = None
+
+        # --- Configure Styles ---
+        self._setup_styles()
+
+        # --- UI Elements ---
+        main_frame = ttk.Frame(master, padding="20")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # App Header
+        header_frame = ttk.Frame(main_frame)
+        header_frame.grid(row=0, column=0, columnspan=2, padx=5, pady=(0, 15), sticky='ew')
+        ttk.Label(header_frame, text="Conversor DICOM", style="Header.TLabel").pack(side=tk.LEFT)
+        ttk.Separator(main_frame, orient='horizontal').grid(row=1, column=0, columnspan=2, sticky='ew', pady=(0, 15), padx=5)
+
+        # Source DICOM Selection
+        ttk.Label(main_frame, text="1. Selecione o DICOM de origem (para modelo de metadados):", style="Step.TLabel").grid(row=2, column=0, padx=5, pady=(0,5), sticky='w')
+        source_dicom_frame = ttk.Frame(main_frame)
+        source_dicom_frame.grid(row=3, column=0, columnspan=2, padx=5, pady=(0,15), sticky='ew')
+        ttk.Entry(source_dicom_frame, textvariable=self.source_dicom_path, width=60, style="App.TEntry").pack(side=tk.LEFT, expand=True, fill=tk.X)
+        ttk.Button(source_dicom_frame, text="Procurar...", command=self.browse_source_dicom, style="Browse.TButton").pack(side=tk.LEFT, padx=(8,0))
+
+        # Extracted DICOM Info Display
+        info_frame = ttk.LabelFrame(main_frame, text="Informações do DICOM de Origem", padding=(10, 8), style="Info.TLabelframe")
+        info_frame.grid(row=4, column=0, columnspan=2, padx=5, pady=10, sticky='ew')
+
+        ttk.Label(info_frame, text="StudyInstanceUID:", style="InfoLabel.TLabel").grid(row=0, column=0, sticky='w', pady=3)
+        ttk.Label(info_frame, textvariable=self.study_instance_uid, wraplength=450, justify=tk.LEFT, style="InfoValue.TLabel").grid(row=0, column=1, sticky='w', padx=5, pady=3)
+        ttk.Label(info_frame, text="Nome do Paciente:", style="InfoLabel.TLabel").grid(row=1, column=0, sticky='w', pady=3)
+        ttk.Label(info_frame, textvariable=self.patient_name, style="InfoValue.TLabel").grid(row=1, column=1, sticky='w', padx=5, pady=3)
+        ttk.Label(info_frame, text="ID do Paciente:", style="InfoLabel.TLabel").grid(row=2, column=0, sticky='w', pady=3)
+        ttk.Label(info_frame, textvariable=self.patient_id, style="InfoValue.TLabel").grid(row=2, column=1, sticky='w', padx=5, pady=3)
+        ttk.Label(info_frame, text="Data do Estudo:", style="InfoLabel.TLabel").grid(row=3, column=0, sticky='w', pady=3)
+        ttk.Label(info_frame, textvariable=self.study_date, style="InfoValue.TLabel").grid(row=3, column=1, sticky='w', padx=5, pady=3)
+        ttk.Label(info_frame, text="Descrição do Estudo:", style="InfoLabel.TLabel").grid(row=4, column=0, sticky='w', pady=3)
+        ttk.Label(info_frame, textvariable=self.study_description, style="InfoValue.TLabel").grid(row=4, column=1, sticky='w', padx=5, pady=3)
+        info_frame.columnconfigure(1, weight=1)
+        
+        # Apply a styled separator between sections
+        ttk.Separator(main_frame, orient='horizontal').grid(row=5, column=0, columnspan=2, sticky='ew', pady=15, padx=5)
+
+        # PDF/Image Selection
+        self.source_file_types = (
+            ("Arquivos Suportados", "*.pdf *.png *.jpg *.jpeg *.bmp *.tiff *.tif *.gif"),
+            ("Arquivos PDF", "*.pdf"),
+            ("Arquivos de Imagem (PNG, JPG, BMP, TIFF, GIF)", "*.png *.jpg *.jpeg *.bmp *.tiff *.tif *.gif"),
+            ("Todos os arquivos", "*.*")
+        )
+        ttk.Label(main_frame, text="2. Selecione o PDF ou Arquivo de Imagem para Converter:", style="Step.TLabel").grid(row=6, column=0, padx=5, pady=(0,5), sticky='w')
+        source_file_frame = ttk.Frame(main_frame)
+        source_file_frame.grid(row=7, column=0, columnspan=2, padx=5, pady=(0,15), sticky='ew')
+        ttk.Entry(source_file_frame, textvariable=self.source_file_path, width=60, style="App.TEntry").pack(side=tk.LEFT, expand=True, fill=tk.X)
+        ttk.Button(source_file_frame, text="Procurar...", command=self.browse_source_file, style="Browse.TButton").pack(side=tk.LEFT, padx=(8,0))
+
+        # Add an information note about saving location, plus the output options
+        options_frame = ttk.Frame(main_frame)
+        options_frame.grid(row=8, column=0, columnspan=2, padx=5, pady=(0,15), sticky='w')
+        ttk.Label(options_frame, text="Nota: Os arquivos DICOM serão salvos na mesma pasta do arquivo de origem", 
+                 style="Note.TLabel").pack(anchor='w')
+        ttk.Checkbutton(options_frame, text="Armazenar PDFs como PDF encapsulado (sem rasterizar as páginas)",
+                        variable=self.encapsulate_pdf).pack(anchor='w', pady=(5,0))
+        compression_frame = ttk.Frame(options_frame)
+        compression_frame.pack(anchor='w', pady=(5,0))
+        ttk.Label(compression_frame, text="Compressão das imagens:").pack(side=tk.LEFT)
+        ttk.Combobox(compression_frame, textvariable=self.compression_choice, values=list(COMPRESSION_CHOICES),
+                     state="readonly", width=36).pack(side=tk.LEFT, padx=(8,0))
+        ttk.Checkbutton(options_frame, text="Converter páginas quase preto e branco em preto e branco puro",
+                        variable=self.bilevel).pack(anchor='w', pady=(5,0))
+        ttk.Checkbutton(options_frame, text="Gravar todas as páginas em um único arquivo multi-frame",
+                        variable=self.multiframe).pack(anchor='w', pady=(5,0))
+
+        # Convert Button - Usando tk.Button em vez de ttk.Button para melhor controle de cores
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=9, column=0, columnspan=2, pady=15)
+        self.convert_button = tk.Button(button_frame, text="Converter e Salvar Nova Série DICOM", 
+                                    command=self.convert_and_save_dicom,
+                                    bg="#FF5722", fg="white", font=('Arial', 11, 'bold'),
+                                    activebackground="#E64A19", activeforeground="white",
+                                    relief=tk.RAISED, padx=15, pady=8, bd=2)
+        self.convert_button.pack(side=tk.LEFT)
+        self.cancel_button = tk.Button(button_frame, text="Cancelar", command=self.cancel_conversion,
+                                    font=('Arial', 11), padx=15, pady=8, bd=2, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
+        self.queue_label = ttk.Label(button_frame, text="", style="Note.TLabel")
+        self.queue_label.pack(side=tk.LEFT, padx=(10, 0))
+
+        # Progress Bar
+        self.progress_label = ttk.Label(main_frame, text="", style="Progress.TLabel")
+        self.progress_label.grid(row=10, column=0, columnspan=2, pady=(10,0), padx=5, sticky='ew')
+        self.progress_bar = ttk.Progressbar(main_frame, orient="horizontal", length=300, mode="determinate", style="App.Horizontal.TProgressbar")
+        self.progress_bar.grid(row=11, column=0, columnspan=2, pady=5, padx=5, sticky='ew')
+        
+        # Attribution text at the bottom
+        ttk.Separator(main_frame, orient='horizontal').grid(row=12, column=0, columnspan=2, sticky='ew', pady=(15, 10), padx=5)
+        ttk.Label(main_frame, text="Desenvolvido por Julio Cesar Nather Junior", style="Attribution.TLabel").grid(row=13, column=0, columnspan=2, padx=5, pady=(0, 5), sticky='e')
+        
+        main_frame.columnconfigure(0, weight=1)
+
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.master.after(EVENT_POLL_INTERVAL_MS, self._poll_events)
+        
+    def _setup_styles(self):
+        """Set up the ttk styles for a more modern UI"""
+        style = ttk.Style()
+        
+        # Define colors
+        primary_color = "#1976D2"  # Medium blue
+        secondary_color = "#64B5F6"  # Light blue
+        text_color = "#212121"  # Almost black
+        bg_color = "#F5F5F5"  # Light gray
+        accent_color = "#FF5722"  # Orange - mais brilhante para o botão de converter
+        hover_color = "#E64A19"  # Dark orange
+        info_bg = "#E3F2FD"  # Very light blue
+        
+        # Configure the window background
+        style.configure("TFrame", background=bg_color)
+        style.configure("TLabel", background=bg_color, foreground=text_color)
+        style.configure("TLabelframe", background=bg_color)
+        style.configure("TLabelframe.Label", background=bg_color, foreground=text_color, font=('Arial', 10, 'bold'))
+        
+        # Header style
+        style.configure("Header.TLabel", font=('Arial', 16, 'bold'), foreground=primary_color, background=bg_color)
+        
+        # Step headers
+        style.configure("Step.TLabel", font=('Arial', 11, 'bold'), foreground=primary_color, background=bg_color)
+        
+        # Info frame
+        style.configure("Info.TLabelframe", background=info_bg)
+        style.configure("Info.TLabelframe.Label", background=bg_color, foreground=primary_color, font=('Arial', 10, 'bold'))
+        style.configure("InfoLabel.TLabel", background=info_bg, foreground=text_color, font=('Arial', 9, 'bold'))
+        style.configure("InfoValue.TLabel", background=info_bg, foreground=text_color)
+        
+        # Note style
+        style.configure("Note.TLabel", foreground="#757575", font=('Arial', 9, 'italic'), background=bg_color)
+        
+        # Entry styling
+        style.configure("App.TEntry", borderwidth=1)
+        
+        # Button styling
+        style.configure("Browse.TButton", font=('Arial', 9))
+        style.configure("Convert.TButton", font=('Arial', 11, 'bold'), background=accent_color, foreground="white")
+        style.map("Convert.TButton",
+                 background=[('active', hover_color), ('pressed', accent_color)],
+                 foreground=[('active', 'white'), ('pressed', 'white')])
+        
+        # Progress indicators
+        style.configure("Progress.TLabel", font=('Arial', 10), background=bg_color)
+        style.configure("App.Horizontal.TProgressbar", background=accent_color, troughcolor=bg_color)
+        
+        # Attribution
+        style.configure("Attribution.TLabel", font=('Arial', 8), foreground="#757575", background=bg_color)
+
+    def browse_source_dicom(self):
+        filepath = filedialog.askopenfilename(
+            title="Selecione o Arquivo DICOM de Origem (modelo de metadados)",
+            filetypes=(("Arquivos DICOM", "*.dcm"), ("Todos os arquivos", "*.*"))
+        )
+        if filepath:
+            self.source_dicom_path.set(filepath)
+            self.load_dicom_info()
+
+    def load_dicom_info(self):
+        try:
+            ds = load_template(self.source_dicom_path.get())
+            self.study_instance_uid.set(ds.get("StudyInstanceUID", "N/A"))
+            self.patient_name.set(str(ds.get("PatientName", "N/A")))
+            self.patient_id.set(ds.get("PatientID", "N/A"))
+            self.study_date.set(ds.get("StudyDate", "N/A"))
+            self.study_description.set(ds.get("StudyDescription", "N/A"))
+        except Exception as e:
+            messagebox.showerror("Erro ao Carregar DICOM de Origem", f"Não foi possível ler ou analisar o arquivo DICOM: {e}\nVerifique se é um arquivo DICOM válido.")
+            self.study_instance_uid.set("N/A"); self.patient_name.set("N/A"); self.patient_id.set("N/A")
+            self.study_date.set("N/A"); self.study_description.set("N/A")
+
+    def browse_source_file(self):
+        filepath = filedialog.askopenfilename(
+            title="Selecione o PDF ou Arquivo de Imagem para Converter",
+            filetypes=self.source_file_types
+        )
+        if filepath:
+            self.source_file_path.set(filepath)
+
+    def _update_progress(self, percent, message):
+        self.progress_label.config(text=message)
+        self.progress_bar["value"] = percent
+
+    def _update_queue_label(self):
+        self.queue_label.config(text=f"Na fila: {len(self.pending_jobs)}" if self.pending_jobs else "")
+
+    def convert_and_save_dicom(self):
+        source_dcm_path = self.source_dicom_path.get()
+        source_file_to_convert = self.source_file_path.get()
+        
+        # Get the directory of the source file as output directory
+        output_dir = os.path.dirname(source_file_to_convert)
+        self.output_folder_path.set(output_dir)
+
+        if not all([source_dcm_path, source_file_to_convert]):
+            messagebox.showerror("Informações Faltando", "Por favor, selecione o DICOM de origem e o arquivo a ser convertido.")
+            return
+
+        output_mode = OUTPUT_MODE_ENCAPSULATED_PDF if self.encapsulate_pdf.get() else OUTPUT_MODE_RASTER
+        compression = COMPRESSION_CHOICES[self.compression_choice.get()]
+        job = GuiConversionJob(source_dcm_path, source_file_to_convert, output_dir, output_mode, compression,
+                               self.bilevel.get(), self.multiframe.get())
+        self.pending_jobs.append(job)
+        self.conversion_executor.submit(self._run_conversion_job, job)
+        self._update_queue_label()
+
+    def cancel_conversion(self):
+        if self.current_job is not None:
+            self.current_job.cancel_event.set()
+            self.progress_label.config(text="Cancelando após a página atual...")
+
+    def on_close(self):
+        for job in self.pending_jobs + [self.current_job]:
+            if job is not None: job.cancel_event.set()
+        self.conversion_executor.shutdown(wait=False)
+        self.master.destroy()
+
+    def _run_conversion_job(self, job):
+        """Worker thread: run one queued conversion and report back through conversion_events."""
+        post = self.conversion_events.put
+        post(("started", job))
+        try:
+            result = convert_file(job.source_dcm_path, job.source_file_to_convert, job.output_dir,
+                                  progress=lambda percent, message: post(("progress", percent, message)),
+                                  cancel_event=job.cancel_event, output_mode=job.output_mode,
+                                  compression=job.compression, bilevel=job.bilevel, multiframe=job.multiframe)
+            post(("done", job, result))
+        except ConversionCancelled as e:
+            post(("cancelled", job, str(e)))
+        except ConversionError as e:
+            post(("error", job, e.title, str(e), f"Conversão falhou: {e.title}."))
+        except FileNotFoundError as e:
+            post(("error", job, "Erro: Arquivo Não Encontrado", str(e), "Conversão falhou: Arquivo não encontrado."))
+        except pydicom.errors.InvalidDicomError as e:
+            post(("error", job, "DICOM de Origem Inválido", f"O DICOM de origem não pôde ser lido: {e}\nPode estar corrompido ou inválido.", "Conversão falhou: DICOM de origem inválido."))
+        except Exception as e:
+            print(traceback.format_exc()) # Log detailed error to console
+            post(("error", job, "Erro de Conversão", f"Ocorreu um erro inesperado durante a conversão: {e}", "Conversão falhou: Erro inesperado."))
+
+    def _poll_events(self):
+        try:
+            while True:
+                self._handle_event(*self.conversion_events.get_nowait())
+        except queue.Empty:
+            pass
+        self.master.after(EVENT_POLL_INTERVAL_MS, self._poll_events)
+
+    def _handle_event(self, kind, *payload):
+        if kind == "progress":
+            if not self.current_job.cancel_event.is_set(): self._update_progress(*payload)
+            return
+        if kind == "started":
+            self.current_job = payload[0]
+            self.pending_jobs.remove(self.current_job)
+            self._update_queue_label()
+            self.progress_bar["maximum"] = 100
+            self._update_progress(0, "Starting conversion...")
+            self.cancel_button.config(state=tk.NORMAL)
+            return
+
+        # The current job finished one way or another
+        self.current_job = None
+        self.cancel_button.config(state=tk.DISABLED)
+        if kind == "done":
+            result = payload[1]
+            if self.pending_jobs: return # Keep going; the final message is shown once the queue is drained
+            # Get the filename of the first DICOM saved (or only one if there's just one image)
+            first_dicom_filename = os.path.basename(result.output_files[0])
+            messagebox.showinfo("Sucesso", f"{result.instance_count} arquivo(s) DICOM criado(s) com sucesso em '{result.output_dir}'.\nArquivo: {first_dicom_filename}")
+        elif kind == "cancelled":
+            self._update_progress(0, payload[1])
+        elif kind == "error":
+            _, title, message, label = payload
+            self._update_progress(0, label)
+            messagebox.showerror(title, message)
+
+
+def run_gui():
+    root = tk.Tk()
+    app = DicomConverterApp(root)
+    root.mainloop()
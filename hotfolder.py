@@ -0,0 +1,255 @@
+"""
+Pasta Monitorada (Hot Folder)
+
+Monitora uma pasta de entrada e converte cada PDF/imagem que chega, usando um pool limitado de
+processos. Um índice por hash de conteúdo registra o que já foi convertido, para que reinícios e
+arquivos duplicados não sejam convertidos de novo.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+from collections import deque
+import datetime
+import hashlib
+import json
+import os
+import time
+
+from pydicom.errors import InvalidDicomError
+
+from batch import BatchJob, BatchOutcome, job_executor, run_job
+from converter import SUPPORTED_EXTENSIONS, available_cores, load_template
+
+TEMPLATE_FILENAME = "template.dcm" # Shared template for a folder and its subfolders
+SIDECAR_TEMPLATE_SUFFIX = ".template.dcm" # laudo.pdf -> laudo.template.dcm
+INDEX_FILENAME = ".img2dicom_index.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class HotFolderStats:
+    started_at: float = field(default_factory=time.monotonic)
+    converted: int = 0
+    skipped: int = 0 # Already in the index (restarts, duplicate drops)
+    failed: int = 0
+    pages: int = 0
+    queued: int = 0 # Stable files waiting for a worker
+    in_flight: int = 0
+    waiting_template: int = 0
+
+    @property
+    def pages_per_second(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def describe(self):
+        return (f"fila={self.queued} em andamento={self.in_flight} sem modelo={self.waiting_template} "
+                f"convertidos={self.converted} já convertidos={self.skipped} falhas={self.failed} "
+                f"páginas={self.pages} ({self.pages_per_second:.2f} páginas/s)")
+
+
+def find_template(source_path, inbox):
+    """Return the sidecar template of `source_path`, else the nearest template.dcm up to `inbox`, else None."""
+    sidecar = os.path.splitext(source_path)[0] + SIDECAR_TEMPLATE_SUFFIX
+    if os.path.isfile(sidecar):
+        return sidecar
+    inbox = os.path.abspath(inbox)
+    folder = os.path.dirname(os.path.abspath(source_path))
+    while True:
+        candidate = os.path.join(folder, TEMPLATE_FILENAME)
+        if os.path.isfile(candidate):
+            return candidate
+        if folder == inbox or os.path.dirname(folder) == folder:
+            return None
+        folder = os.path.dirname(folder)
+
+
+def content_key(source_path, template_path):
+    """Identify a conversion by the source's SHA-256 and the study it is filed into."""
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    template = load_template(template_path)
+    return f"{digest.hexdigest()}:{template.get('StudyInstanceUID', '')}"
+
+
+class ConversionIndex:
+    """JSON file mapping content keys to the series they were converted into."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def record(self, key, source_path, series_instance_uid, output_files):
+        self.entries[key] = {
+            "source": source_path,
+            "series_instance_uid": series_instance_uid,
+            "output_files": output_files,
+            "converted_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(temp_path, self.path) # Never leave a half-written index behind
+
+
+class HotFolderWatcher:
+    """
+    Polls `inbox` and converts each new, fully written PDF/image with its template.
+
+    A file is picked up only after its size and mtime stayed the same for `stable_polls`
+    consecutive polls, and so is its template. Files without a template yet are retried on later
+    polls; files that fail are retried only once they change on disk. A worker process that dies
+    (e.g. killed for running out of memory) fails the jobs it was running and the pool is recreated.
+    """
+
+    def __init__(self, inbox, workers=None, index_path=None, output_dir=None, poll_interval=2.0, stable_polls=2,
+                 convert_options=None, on_outcome=None, isolate_jobs=False):
+        self.inbox = os.path.abspath(inbox)
+        self.workers = workers or available_cores()
+        self.index = ConversionIndex(index_path or os.path.join(self.inbox, INDEX_FILENAME))
+        self.output_dir = output_dir
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.on_outcome = on_outcome
+        self.stats = HotFolderStats()
+        convert_options = dict(convert_options or {})
+        convert_options.setdefault("encode_workers", max(1, available_cores() // self.workers))
+        self._job_runner = partial(run_job, convert_options=convert_options)
+        self.isolate_jobs = isolate_jobs # One process per file, for per-file peak RSS (see batch.job_executor)
+        self._executor = None
+        self._observed = {} # path -> (size, mtime_ns, polls unchanged)
+        self._handled = {} # path -> (size, mtime_ns) already converted, skipped or failed
+        self._queue = deque() # (job, key) ready to convert
+        self._running = {} # future -> (job, key)
+        self._templates = {} # template path -> (size, mtime_ns, poll it was first seen unchanged)
+        self._poll_number = 0
+
+    def _scan(self):
+        for folder, _, filenames in os.walk(self.inbox):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                    yield os.path.join(folder, filename)
+
+    def _stable_files(self):
+        """Yield (path, signature) for files whose size and mtime stopped changing."""
+        present = set()
+        for path in self._scan():
+            present.add(path)
+            try:
+                stat = os.stat(path)
+            except OSError: # Removed between the scan and the stat
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._handled.get(path) == signature:
+                continue
+            previous = self._observed.get(path)
+            polls = previous[2] + 1 if previous and previous[:2] == signature else 0
+            self._observed[path] = signature + (polls,)
+            if polls >= self.stable_polls - 1:
+                yield path, signature
+        for path in list(self._observed):
+            if path not in present: del self._observed[path]
+
+    def _template_is_stable(self, template_path):
+        """Whether the template's size and mtime held for `stable_polls` polls, like the source files."""
+        try:
+            stat = os.stat(template_path)
+        except OSError:
+            return False
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self._templates.get(template_path)
+        if previous is None or previous[:2] != signature:
+            self._templates[template_path] = signature + (self._poll_number,)
+            return self.stable_polls <= 1
+        return self._poll_number - previous[2] >= self.stable_polls - 1
+
+    def poll(self):
+        """Scan once, queue new stable files, start conversions and collect finished ones."""
+        self._poll_number += 1
+        self._collect_finished()
+        queued_keys = {key for _, key in self._queue} | {key for _, key in self._running.values()}
+        self.stats.waiting_template = 0
+        for path, signature in self._stable_files():
+            template_path = find_template(path, self.inbox)
+            try:
+                key = content_key(path, template_path) if template_path and self._template_is_stable(template_path) else None
+            except (OSError, InvalidDicomError): # Template unreadable (or replaced while reading it)
+                key = None
+            if key is None:
+                self.stats.waiting_template += 1
+                continue
+            del self._observed[path]
+            self._handled[path] = signature
+            if key in self.index or key in queued_keys:
+                self.stats.skipped += 1
+                continue
+            queued_keys.add(key)
+            self._queue.append((BatchJob(template_path, path, self.output_dir), key))
+        self._start_jobs()
+        self.stats.queued, self.stats.in_flight = len(self._queue), len(self._running)
+
+    def _start_jobs(self):
+        if self._queue and self._executor is None:
+            self._executor = job_executor(self.workers, self.isolate_jobs)
+        while self._queue and len(self._running) < self.workers:
+            job, key = self._queue.popleft()
+            self._running[self._executor.submit(self._job_runner, job)] = (job, key)
+
+    def _collect_finished(self, wait=False):
+        for future in list(self._running):
+            if not wait and not future.done():
+                continue
+            job, key = self._running.pop(future)
+            try:
+                outcome = future.result()
+            except BrokenProcessPool as e: # A worker died; every job it had in flight is lost
+                outcome = BatchOutcome(job, error=f"Processo de conversão encerrado inesperadamente: {e}")
+                self._discard_executor()
+            if outcome.ok:
+                self.index.record(key, outcome.job.source_path, outcome.series_instance_uid, outcome.output_files)
+                self.stats.converted += 1
+                self.stats.pages += outcome.page_count
+            else:
+                self.stats.failed += 1
+            if self.on_outcome: self.on_outcome(outcome)
+
+    def _discard_executor(self):
+        # A broken pool accepts no more jobs; _start_jobs creates a new one
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def run(self, stop_event=None, report_interval=30.0, on_report=None):
+        """Poll until `stop_event` is set (or KeyboardInterrupt), then finish the conversions in flight."""
+        next_report = time.monotonic() + report_interval
+        try:
+            while stop_event is None or not stop_event.is_set():
+                self.poll()
+                if on_report and time.monotonic() >= next_report:
+                    on_report(self.stats)
+                    next_report = time.monotonic() + report_interval
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self._queue.clear()
+        self._collect_finished(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.stats.queued, self.stats.in_flight = 0, 0
@@ -0,0 +1,159 @@
+"""
+Instrumentação da Conversão
+
+Mede o tempo gasto em cada etapa da conversão (leitura do modelo, renderização do PDF, extração dos
+pixels, montagem do dataset, codificação/gravação, envio) e o pico de memória, e grava um relatório
+por execução em JSON Lines. Também permite gravar um perfil do cProfile por arquivo.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+from dataclasses import asdict, is_dataclass
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+
+def peak_rss_bytes(children=False):
+    """
+    Peak resident set size of this process over its whole lifetime, or None where it cannot be read.
+
+    With `children`, the peak of the largest child process already waited for (the encode pool's
+    workers once the pool is shut down). Both only describe one file when the conversion runs in a
+    process of its own, as run_batch does with `isolate_jobs`.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Linux reports KiB, macOS bytes
+
+
+class StageTimings:
+    """
+    Accumulates wall time and call counts per named stage; safe to use from several threads.
+
+    With `trace_memory`, tracemalloc runs from start() to stop() (or the `with` block) and the peak
+    of Python-level allocations (NumPy buffers, pydicom elements, bytes) is reported. Pillow's image
+    buffers are allocated outside tracemalloc and only show up in the process peak RSS.
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {} # name -> [seconds, calls]
+        self.traced_peak_bytes = None
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.traced_peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self._started_tracing: tracemalloc.stop()
+        self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def add(self, name, seconds, calls=1):
+        with self._lock:
+            totals = self.stages.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def as_dict(self):
+        with self._lock:
+            stages = {name: {"seconds": round(seconds, 6), "calls": calls} for name, (seconds, calls) in self.stages.items()}
+        traced_peak = self.traced_peak_bytes
+        if self.trace_memory and tracemalloc.is_tracing(): traced_peak = tracemalloc.get_traced_memory()[1]
+        return {"stages": stages, "traced_peak_bytes": traced_peak, "peak_rss_bytes": peak_rss_bytes(),
+                "peak_child_rss_bytes": peak_rss_bytes(children=True)}
+
+
+class _NoTimings:
+    """Stand-in used when instrumentation is off; every call is a no-op."""
+
+    enabled = False
+    _null_stage = contextlib.nullcontext()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+    def add(self, name, seconds, calls=1):
+        pass
+
+    def stage(self, name):
+        return self._null_stage
+
+
+NO_TIMINGS = _NoTimings()
+
+
+def timed_iter(iterable, timings, name):
+    """Yield from `iterable`, timing each wait for the next item as stage `name`; closes it when done."""
+    iterator = iter(iterable)
+    try:
+        while True:
+            with timings.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close: close()
+
+
+@contextlib.contextmanager
+def profiled(profile_path):
+    """Run the block under cProfile and dump the stats to `profile_path` (no-op when it is None)."""
+    if profile_path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(profile_path)), exist_ok=True)
+        profiler.dump_stats(profile_path)
+
+
+def append_report(report_path, record):
+    """Append `record` (a dict or dataclass) as one JSON line to `report_path`."""
+    if is_dataclass(record): record = asdict(record)
+    with open(report_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
@@ -0,0 +1,289 @@
+"""
+Gravação de DICOM Multi-frame em Fluxo
+
+Acumula as páginas de um documento em um arquivo temporário em disco e depois grava uma única
+instância multi-frame, quadro a quadro, sem manter todas as páginas na memória. Também grava imagens
+muito grandes faixa por faixa (`write_strips`), sem montar os pixels completos na memória. Não
+conhece o modelo de metadados: recebe o cabeçalho pronto de `converter`.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+from pydicom.filebase import DicomBytesIO
+from pydicom.filewriter import write_dataset, write_file_meta_info
+from pydicom.uid import DeflatedExplicitVRLittleEndian, RLELossless
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from dataclasses import dataclass
+import numpy as np
+import os
+import struct
+import tempfile
+import zlib
+
+try:
+    from pydicom.pixels.encoders import RLELosslessEncoder
+except ImportError: # pydicom < 3.0
+    from pydicom.encoders import RLELosslessEncoder
+
+# pydicom's own RLE encoder is pure Python (seconds per 300 dpi page); prefer a native plugin when installed
+RLE_ENCODING_PLUGIN = next((plugin for plugin in ("pylibjpeg", "gdcm") if plugin in RLELosslessEncoder.available_plugins),
+                           "pydicom")
+
+PAD_VALUE = 255 # Pages are padded with white to the common frame size
+PIXEL_DATA_TAG = b"\xe0\x7f\x10\x00" # (7FE0,0010) little endian
+ITEM_TAG = b"\xfe\xff\x00\xe0" # (FFFE,E000)
+SEQUENCE_DELIMITER = b"\xfe\xff\xdd\xe0\x00\x00\x00\x00" # (FFFE,E0DD), length 0
+UNDEFINED_LENGTH = 0xFFFFFFFF
+MAX_PIXEL_DATA_LENGTH = 0xFFFFFFFE # Largest even explicit length: native/Deflate Pixel Data must fit in 4 GiB
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class SpooledFrame:
+    offset: int
+    rows: int
+    columns: int
+    samples_per_pixel: int
+
+
+class FrameSpool:
+    """Temporary on-disk store of frames, each kept in its own size and sample count until written."""
+
+    def __init__(self, directory=None):
+        self.frames = []
+        self._file = tempfile.TemporaryFile(dir=directory or None)
+
+    def add_frame(self, pixel_bytes, rows, columns, samples_per_pixel):
+        self.frames.append(SpooledFrame(self._file.seek(0, 2), rows, columns, samples_per_pixel))
+        self._file.write(pixel_bytes)
+
+    def add_frame_strips(self, strips, rows, columns, samples_per_pixel):
+        """Add a frame given as (strip_bytes, strip_rows) from top to bottom, without joining them in memory."""
+        self.frames.append(SpooledFrame(self._file.seek(0, 2), rows, columns, samples_per_pixel))
+        for strip_bytes, _ in strips:
+            self._file.write(strip_bytes)
+
+    def pixel_data_length(self, next_frame=None):
+        """Native Pixel Data length of the normalized frames, counting one more (rows, columns, samples) `next_frame`."""
+        shapes = [(f.rows, f.columns, f.samples_per_pixel) for f in self.frames] + ([next_frame] if next_frame else [])
+        if not shapes: return 0
+        rows, columns, samples = (max(sizes) for sizes in zip(*shapes))
+        return rows * columns * samples * len(shapes)
+
+    @property
+    def rows(self):
+        return max(f.rows for f in self.frames)
+
+    @property
+    def columns(self):
+        return max(f.columns for f in self.frames)
+
+    @property
+    def samples_per_pixel(self):
+        return max(f.samples_per_pixel for f in self.frames)
+
+    def iter_normalized_frames(self):
+        """Yield every frame padded to the common size and expanded to the common sample count."""
+        rows, columns, samples = self.rows, self.columns, self.samples_per_pixel
+        for frame in self.frames:
+            self._file.seek(frame.offset)
+            frame_bytes = self._file.read(frame.rows * frame.columns * frame.samples_per_pixel)
+            if (frame.rows, frame.columns, frame.samples_per_pixel) == (rows, columns, samples):
+                yield frame_bytes
+                continue
+            pixels = np.frombuffer(frame_bytes, dtype=np.uint8).reshape(frame.rows, frame.columns, frame.samples_per_pixel)
+            normalized = np.full((rows, columns, samples), PAD_VALUE, dtype=np.uint8)
+            normalized[:frame.rows, :frame.columns] = pixels # Broadcasts grayscale frames into RGB
+            yield normalized.tobytes()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def encode_rle_frame(frame_bytes, rows, columns, samples_per_pixel):
+    photometric = {"photometric_interpretation": "MONOCHROME2"}
+    if samples_per_pixel == 3: photometric = {"photometric_interpretation": "RGB", "planar_configuration": 0}
+    return RLELosslessEncoder.encode(
+        frame_bytes, rows=rows, columns=columns, samples_per_pixel=samples_per_pixel, bits_allocated=8,
+        bits_stored=8, pixel_representation=0, number_of_frames=1, encoding_plugin=RLE_ENCODING_PLUGIN, **photometric,
+    )
+
+
+class _DeflatingSink:
+    def __init__(self, fp):
+        self._fp = fp
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    def write(self, data):
+        self._fp.write(self._compressor.compress(data))
+
+    def close(self):
+        self._fp.write(self._compressor.flush())
+
+
+class _PlainSink:
+    def __init__(self, fp):
+        self.write = fp.write
+
+    def close(self):
+        pass
+
+
+def _iter_rle_frames(spool, workers, executor=None, max_in_flight=None):
+    """
+    Yield RLE-encoded frames in order, encoding them in parallel (on `executor` if given) with up to
+    two frames per worker, and never more than `max_in_flight` raw frames, in flight.
+    """
+    rows, columns, samples = spool.rows, spool.columns, spool.samples_per_pixel
+    if workers <= 1:
+        for frame_bytes in spool.iter_normalized_frames():
+            yield encode_rle_frame(frame_bytes, rows, columns, samples)
+        return
+    limit = max(1, min(workers * 2, max_in_flight or workers * 2))
+    with contextlib.nullcontext(executor) if executor else ProcessPoolExecutor(max_workers=min(workers, limit)) as executor:
+        pending = deque()
+        for frame_bytes in spool.iter_normalized_frames():
+            pending.append(executor.submit(encode_rle_frame, frame_bytes, rows, columns, samples))
+            if len(pending) >= limit:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _write_header(fp, ds, transfer_syntax):
+    """Write the preamble, file meta and every attribute of `ds`; return the sink for the Pixel Data element."""
+    ds.file_meta.TransferSyntaxUID = transfer_syntax
+    header = DicomBytesIO()
+    header.is_little_endian = True
+    header.is_implicit_VR = False
+    write_dataset(header, ds)
+
+    fp.write(b"\x00" * 128 + b"DICM")
+    meta = DicomBytesIO()
+    meta.is_little_endian = True
+    meta.is_implicit_VR = False
+    write_file_meta_info(meta, ds.file_meta)
+    fp.write(meta.getvalue())
+
+    sink = _DeflatingSink(fp) if transfer_syntax == DeflatedExplicitVRLittleEndian else _PlainSink(fp)
+    sink.write(header.getvalue())
+    return sink
+
+
+def write_multiframe(ds, output_filename, spool, transfer_syntax, workers=1, executor=None, max_in_flight=None):
+    """
+    Write `ds` (every attribute except PixelData) followed by the spooled frames as one file.
+
+    The Pixel Data element is streamed frame by frame: native for Explicit VR Little Endian,
+    deflated together with the rest of the dataset for Deflated Explicit VR Little Endian, and as
+    one encapsulated fragment per frame for RLE Lossless, encoded on `workers` processes (or on a
+    shared `executor`) with at most `max_in_flight` frames queued. Returns the number of uncompressed pixel bytes.
+    """
+    pixel_bytes = spool.pixel_data_length()
+    if transfer_syntax != RLELossless and pixel_bytes + pixel_bytes % 2 > MAX_PIXEL_DATA_LENGTH:
+        raise ValueError(f"{pixel_bytes} bytes of native Pixel Data do not fit in an explicit-length element")
+
+    with open(output_filename, "wb") as fp:
+        sink = _write_header(fp, ds, transfer_syntax)
+        if transfer_syntax == RLELossless:
+            sink.write(PIXEL_DATA_TAG + b"OB\x00\x00" + struct.pack("<I", UNDEFINED_LENGTH))
+            sink.write(ITEM_TAG + struct.pack("<I", 0)) # Empty Basic Offset Table
+            for encoded in _iter_rle_frames(spool, workers, executor, max_in_flight):
+                if len(encoded) % 2: encoded += b"\x00"
+                sink.write(ITEM_TAG + struct.pack("<I", len(encoded)))
+                sink.write(encoded)
+            sink.write(SEQUENCE_DELIMITER)
+        else:
+            padding = b"\x00" if pixel_bytes % 2 else b""
+            sink.write(PIXEL_DATA_TAG + b"OB\x00\x00" + struct.pack("<I", pixel_bytes + len(padding)))
+            for frame_bytes in spool.iter_normalized_frames():
+                sink.write(frame_bytes)
+            sink.write(padding)
+        sink.close()
+
+    return pixel_bytes
+
+
+def _packbits_length(segment, decoded_length):
+    """Length of an RLE segment up to `decoded_length` decoded bytes, i.e. without the encoder's pad byte."""
+    position = produced = 0
+    while produced < decoded_length:
+        header = segment[position]
+        if header < 128: # Literal run of header + 1 bytes
+            produced += header + 1
+            position += header + 2
+        elif header > 128: # Replicate run of 257 - header bytes
+            produced += 257 - header
+            position += 2
+        else: # 128 is a no-op
+            position += 1
+    return position
+
+
+def _write_rle_strips(sink, strips, rows, columns, samples_per_pixel, directory):
+    """
+    Write one RLE Lossless fragment for a frame given as row strips.
+
+    RLE encodes every row separately, so each strip is encoded on its own and its segments are
+    appended to one temporary file per segment; the segments are then written after the RLE header.
+    """
+    segments = [tempfile.TemporaryFile(dir=directory or None) for _ in range(samples_per_pixel)]
+    try:
+        for strip_bytes, strip_rows in strips:
+            encoded = encode_rle_frame(strip_bytes, strip_rows, columns, samples_per_pixel)
+            offsets = struct.unpack_from("<15I", encoded, 4)[:samples_per_pixel] + (len(encoded),)
+            for segment_file, start, end in zip(segments, offsets, offsets[1:]):
+                segment = encoded[start:end]
+                segment_file.write(segment[:_packbits_length(segment, strip_rows * columns)])
+
+        lengths = []
+        for segment_file in segments:
+            length = segment_file.tell()
+            if length % 2: segment_file.write(b"\x00"); length += 1
+            lengths.append(length)
+        offsets = [64 + sum(lengths[:i]) for i in range(samples_per_pixel)]
+        rle_header = struct.pack("<16I", samples_per_pixel, *(offsets + [0] * (15 - samples_per_pixel)))
+
+        sink.write(PIXEL_DATA_TAG + b"OB\x00\x00" + struct.pack("<I", UNDEFINED_LENGTH))
+        sink.write(ITEM_TAG + struct.pack("<I", 0)) # Empty Basic Offset Table
+        sink.write(ITEM_TAG + struct.pack("<I", 64 + sum(lengths)))
+        sink.write(rle_header)
+        for segment_file in segments:
+            segment_file.seek(0)
+            for chunk in iter(lambda: segment_file.read(COPY_CHUNK_SIZE), b""):
+                sink.write(chunk)
+        sink.write(SEQUENCE_DELIMITER)
+    finally:
+        for segment_file in segments: segment_file.close()
+
+
+def write_strips(ds, output_filename, strips, transfer_syntax):
+    """
+    Write `ds` (every attribute except PixelData) followed by a single frame given as row strips.
+
+    `strips` yields (strip_bytes, strip_rows) from top to bottom and is consumed once, so only one
+    strip is in memory at a time. Returns the number of uncompressed pixel bytes.
+    """
+    rows, columns, samples_per_pixel = ds.Rows, ds.Columns, ds.SamplesPerPixel
+    pixel_bytes = rows * columns * samples_per_pixel
+    with open(output_filename, "wb") as fp:
+        sink = _write_header(fp, ds, transfer_syntax)
+        if transfer_syntax == RLELossless:
+            _write_rle_strips(sink, strips, rows, columns, samples_per_pixel, os.path.dirname(output_filename))
+        else:
+            padding = b"\x00" if pixel_bytes % 2 else b""
+            sink.write(PIXEL_DATA_TAG + b"OB\x00\x00" + struct.pack("<I", pixel_bytes + len(padding)))
+            for strip_bytes, _ in strips:
+                sink.write(strip_bytes)
+            sink.write(padding)
+        sink.close()
+    return pixel_bytes
@@ -0,0 +1,174 @@
+"""
+Servidor de Conversão
+
+Mantém um processo de conversão residente, para scripts que fazem muitas conversões curtas: o
+interpretador, os módulos já importados, o cache de modelos DICOM e o pool de processos de
+codificação continuam prontos entre os pedidos, e cada pedido custa apenas a própria conversão.
+
+Os pedidos chegam em JSON Lines, um objeto por linha, pela entrada padrão ou por um socket TCP
+local, e cada um recebe uma linha JSON de resposta. Os pedidos são atendidos um de cada vez.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import json
+import os
+import socketserver
+import sys
+import threading
+
+from batch import BatchJob, run_job
+from converter import COMPRESSION_NONE, COMPRESSION_TRANSFER_SYNTAXES, PDF_PAGE_WINDOW, available_cores
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 11180
+# convert_file options a request may set; the rest (destinations, render policy...) come from the command line
+REQUEST_OPTIONS = ("output_mode", "compression", "detect_grayscale", "bilevel", "multiframe", "write_files", "instrument")
+
+
+class ConversionServer:
+    """
+    Answers conversion requests with a warm encode pool.
+
+    The pool is only needed for compressed pages (uncompressed ones are written inline), so it is
+    started with the server when its default compression is on, else on the first compressed request.
+
+    A request is a dict such as {"id": 1, "template": "modelo.dcm", "source": "laudo.pdf",
+    "output_dir": "saida", "options": {"compression": "rle"}}; the response repeats the `id` and
+    carries the batch report record (see BatchOutcome.report_record) plus the output files.
+    {"op": "ping"} reports the conversions so far and {"op": "shutdown"} stops the server.
+    Requests without "output_dir" use `output_dir` (or the source file's folder); `on_outcome` is
+    called with each BatchOutcome.
+    """
+
+    def __init__(self, convert_options=None, encode_workers=None, output_dir=None, on_outcome=None):
+        self.convert_options = dict(convert_options or {})
+        self.encode_workers = encode_workers or available_cores()
+        # Pages queued for encoding are capped by the page window, so a larger pool would have idle processes
+        self.pool_size = min(self.encode_workers, self.convert_options.get("pdf_page_window", PDF_PAGE_WINDOW))
+        self.output_dir = output_dir
+        self.on_outcome = on_outcome
+        self.conversions = 0
+        self.stopped = threading.Event()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._encode_executor(self.convert_options.get("compression", COMPRESSION_NONE))
+        return self
+
+    def _encode_executor(self, compression):
+        """The shared encode pool for a request with `compression`, or None when it writes pages inline."""
+        if compression not in COMPRESSION_TRANSFER_SYNTAXES or compression == COMPRESSION_NONE or self.pool_size <= 1:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            # Start every worker now, so they are all warm by the next compressed page
+            for future in [self._executor.submit(os.getpid) for _ in range(self.pool_size)]: future.result()
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def handle(self, request):
+        """Run one request and return its response dict; errors are reported in the response."""
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "O pedido deve ser um objeto JSON."}
+        response = {"id": request.get("id")}
+        op = request.get("op", "convert")
+        if op == "ping":
+            return {**response, "ok": True, "conversions": self.conversions}
+        if op == "shutdown":
+            self.stopped.set()
+            return {**response, "ok": True}
+        if op != "convert":
+            return {**response, "ok": False, "error": f"Operação desconhecida '{op}'."}
+        if not request.get("template") or not request.get("source"):
+            return {**response, "ok": False, "error": "Pedido sem 'template' ou 'source'."}
+        options = request.get("options") or {}
+        if not isinstance(options, dict):
+            return {**response, "ok": False, "error": "'options' deve ser um objeto JSON."}
+        unknown = sorted(set(options) - set(REQUEST_OPTIONS))
+        if unknown:
+            return {**response, "ok": False, "error": f"Opção(ões) não aceita(s) no pedido: {', '.join(unknown)}."}
+
+        job = BatchJob(request["template"], request["source"], request.get("output_dir") or self.output_dir)
+        convert_options = {**self.convert_options, **options, "encode_workers": self.encode_workers}
+        with self._lock: # One conversion at a time; it already uses every encode worker
+            convert_options["encode_executor"] = self._encode_executor(convert_options.get("compression", COMPRESSION_NONE))
+            outcome = run_job(job, convert_options)
+            self.conversions += 1
+            if self.on_outcome: self.on_outcome(outcome)
+        return {**response, **outcome.report_record(), "output_files": outcome.output_files,
+                "series_instance_uid": outcome.series_instance_uid}
+
+    def handle_line(self, line):
+        """handle() for one JSON line; never raises, so no request can stop the server."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"ok": False, "error": f"JSON inválido: {e}"}
+        try:
+            return self.handle(request)
+        except Exception as e:
+            return {"id": request.get("id") if isinstance(request, dict) else None, "ok": False,
+                    "error": f"Erro interno: {type(e).__name__}: {e}"}
+
+
+def _encode_response(response):
+    return json.dumps(response, ensure_ascii=False, default=str) + "\n"
+
+
+def serve_stdio(server, stdin=None, stdout=None):
+    """Answer one request per line of `stdin` until EOF or a shutdown request."""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    for line in stdin:
+        if not line.strip():
+            continue
+        with contextlib.redirect_stdout(sys.stderr): # stdout only carries responses
+            response = server.handle_line(line)
+        stdout.write(_encode_response(response))
+        stdout.flush()
+        if server.stopped.is_set():
+            break
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(_encode_response(self.server.conversion_server.handle_line(line)).encode("utf-8"))
+            if self.server.conversion_server.stopped.is_set():
+                threading.Thread(target=self.server.shutdown).start() # shutdown() waits for serve_forever
+                break
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_socket(server, host=SERVER_HOST, port=SERVER_PORT, on_ready=None):
+    """
+    Answer requests on a TCP socket (localhost by default) until a shutdown request.
+
+    Each connection may send any number of request lines; connections are served concurrently but
+    conversions still run one at a time. `on_ready` is called with the bound (host, port).
+    """
+    with _TCPServer((host, port), _RequestHandler) as tcp_server:
+        tcp_server.conversion_server = server
+        if on_ready: on_ready(tcp_server.server_address)
+        tcp_server.serve_forever()
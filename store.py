@@ -0,0 +1,202 @@
+"""
+Envio DICOM (C-STORE)
+
+Envia as instâncias geradas diretamente da memória para um ou mais SCPs de armazenamento (PACS),
+sem gravar e reler os arquivos. Cada destino usa uma única associação por série, reaproveitada para
+todas as instâncias, e os destinos recebem em paralelo, com novas tentativas e espera exponencial.
+Também inclui um Storage SCP local mínimo para testes.
+
+Depende do pacote opcional pynetdicom, importado apenas quando o envio é usado.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import pydicom
+from pydicom.uid import ExplicitVRLittleEndian
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import os
+import time
+
+from converter import (ConversionError, SECONDARY_CAPTURE_SOP_CLASS_UID, MULTIFRAME_GRAYSCALE_BYTE_SC_SOP_CLASS_UID,
+                       MULTIFRAME_TRUE_COLOR_SC_SOP_CLASS_UID, ENCAPSULATED_PDF_SOP_CLASS_UID)
+
+STORE_SOP_CLASSES = (SECONDARY_CAPTURE_SOP_CLASS_UID, MULTIFRAME_GRAYSCALE_BYTE_SC_SOP_CLASS_UID,
+                     MULTIFRAME_TRUE_COLOR_SC_SOP_CLASS_UID, ENCAPSULATED_PDF_SOP_CLASS_UID)
+CALLING_AE_TITLE = "IMG2DICOM"
+STORE_MAX_RETRIES = 3
+STORE_BACKOFF_SECONDS = 1.0 # Doubled after every failed attempt
+STORE_MAX_IN_FLIGHT = 4 # Instances queued per destination before the converter waits
+SCP_AE_TITLE = "STORESCP"
+SCP_PORT = 11112
+
+
+class StoreError(ConversionError):
+    title = "Erro no Envio DICOM"
+
+
+@dataclass(frozen=True)
+class StoreDestination:
+    ae_title: str
+    host: str
+    port: int
+
+    @classmethod
+    def parse(cls, text):
+        """Parse `AET@host:port`, e.g. `PACS@10.0.0.5:104`."""
+        try:
+            ae_title, address = text.split("@", 1)
+            host, port = address.rsplit(":", 1)
+            return cls(ae_title, host, int(port))
+        except ValueError:
+            raise ValueError(f"Destino inválido '{text}'; use AET@host:porta.") from None
+
+    def __str__(self):
+        return f"{self.ae_title}@{self.host}:{self.port}"
+
+
+def _import_pynetdicom():
+    try:
+        import pynetdicom
+    except ImportError:
+        raise StoreError("O envio DICOM requer o pacote pynetdicom (pip install pynetdicom).") from None
+    return pynetdicom
+
+
+def _is_stored(status):
+    # 0x0000 success; 0xB000, 0xB006 and 0xB007 are warnings, the instance was still stored
+    return status is not None and (status == 0x0000 or status & 0xF000 == 0xB000)
+
+
+class _DestinationSender:
+    """Sends to one destination on its own thread, keeping a single association open between instances."""
+
+    def __init__(self, destination, transfer_syntax, calling_ae_title, max_retries, backoff):
+        self.destination = destination
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sent = 0
+        self._ae = _import_pynetdicom().AE(ae_title=calling_ae_title)
+        # One context per transfer syntax, so the SCP cannot settle on a syntax the instances are not
+        # encoded in; Encapsulated PDF instances are always Explicit VR Little Endian
+        for sop_class_uid in STORE_SOP_CLASSES:
+            for syntax in dict.fromkeys([transfer_syntax, ExplicitVRLittleEndian]):
+                self._ae.add_requested_context(sop_class_uid, syntax)
+        self._assoc = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+
+    def submit(self, dataset):
+        self._pending.append(self._executor.submit(self._send, dataset))
+        while len(self._pending) > STORE_MAX_IN_FLIGHT:
+            self._pending.popleft().result()
+
+    def flush(self):
+        while self._pending:
+            self._pending.popleft().result()
+
+    def _associate(self):
+        assoc = self._ae.associate(self.destination.host, self.destination.port, ae_title=self.destination.ae_title)
+        if not assoc.is_established:
+            raise ConnectionError("associação rejeitada ou sem resposta")
+        return assoc
+
+    def _send(self, dataset):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt: time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                if self._assoc is None or not self._assoc.is_established:
+                    self._assoc = self._associate()
+                response = self._assoc.send_c_store(dataset)
+            except ValueError as e: # No accepted presentation context: retrying cannot help
+                raise StoreError(f"{self.destination} não aceita esta instância: {e}") from e
+            except (OSError, RuntimeError) as e:
+                error = str(e)
+                self._abort()
+                continue
+            status = response.get("Status") if response else None
+            if _is_stored(status):
+                self.sent += 1
+                return
+            error = f"status 0x{status:04X}" if status is not None else "sem resposta"
+            self._abort()
+        raise StoreError(f"Falha ao enviar para {self.destination} após {self.max_retries + 1} tentativa(s): {error}")
+
+    def _abort(self):
+        if self._assoc is not None:
+            self._assoc.abort()
+            self._assoc = None
+
+    def close(self, release=True):
+        for future in self._pending: future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        if self._assoc is not None and self._assoc.is_established:
+            if release: self._assoc.release()
+            else: self._assoc.abort()
+        self._assoc = None
+
+
+class StoreSink:
+    """
+    Sends the instances of one series to every destination with C-STORE.
+
+    Each destination opens its association on the first instance and keeps it for the rest of the
+    series; destinations are served concurrently, each in send order. `send` accepts a Dataset
+    (sent from memory) or the path of a file already written. A destination that still fails after
+    `max_retries` retries makes the next send (or flush) raise StoreError.
+    """
+
+    def __init__(self, destinations, transfer_syntax=ExplicitVRLittleEndian, calling_ae_title=CALLING_AE_TITLE,
+                 max_retries=STORE_MAX_RETRIES, backoff=STORE_BACKOFF_SECONDS):
+        self._senders = [_DestinationSender(d, transfer_syntax, calling_ae_title, max_retries, backoff) for d in destinations]
+
+    @property
+    def sent(self):
+        """Instances stored on every destination."""
+        return min((s.sent for s in self._senders), default=0)
+
+    def send(self, dataset):
+        for sender in self._senders: sender.submit(dataset)
+
+    def flush(self):
+        for sender in self._senders: sender.flush()
+
+    def close(self, release=True):
+        for sender in self._senders: sender.close(release)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None: self.flush()
+        finally:
+            self.close(release=exc_type is None)
+
+
+def start_storage_scp(port=SCP_PORT, output_dir=None, ae_title=SCP_AE_TITLE, host="", on_stored=None):
+    """
+    Start a minimal Storage SCP in the background and return its server (call server.shutdown()).
+
+    Accepts every storage SOP class in every transfer syntax. Received instances are written to
+    `output_dir` as {SOPInstanceUID}.dcm when given; `on_stored` is called with each dataset.
+    """
+    netdicom = _import_pynetdicom()
+    if output_dir: os.makedirs(output_dir, exist_ok=True)
+
+    def handle_store(event):
+        ds = event.dataset
+        ds.file_meta = event.file_meta
+        if output_dir:
+            pydicom.dcmwrite(os.path.join(output_dir, f"{ds.SOPInstanceUID}.dcm"), ds, write_like_original=False)
+        if on_stored: on_stored(ds)
+        return 0x0000
+
+    ae = netdicom.AE(ae_title=ae_title)
+    for context in netdicom.AllStoragePresentationContexts:
+        ae.add_supported_context(context.abstract_syntax, netdicom.ALL_TRANSFER_SYNTAXES)
+    return ae.start_server((host, port), block=False, evt_handlers=[(netdicom.evt.EVT_C_STORE, handle_store)])
@@ -0,0 +1,42 @@
+"""
+Apoio aos Testes
+
+Código comum aos arquivos de teste: põe a raiz do repositório no `sys.path`, para que cada arquivo
+também possa ser executado diretamente, e oferece `TemplateTestCase`, com uma pasta temporária e um
+DICOM modelo sintético (`benchmark.write_synthetic_template`) criados uma vez por classe.
+
+Execute os testes com `python -m unittest discover tests` (ou `python -m pytest tests`).
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import write_synthetic_template
+
+
+class TemplateTestCase(unittest.TestCase):
+    """Test case with a class-wide temporary `workdir` holding a synthetic `template` DICOM."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.workdir = cls._tmp.name
+        cls.template = os.path.join(cls.workdir, "template.dcm")
+        write_synthetic_template(cls.template)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+        super().tearDownClass()
+
+    def new_dir(self):
+        """A new empty folder inside `workdir`."""
+        return tempfile.mkdtemp(dir=self.workdir)
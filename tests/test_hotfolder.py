@@ -0,0 +1,99 @@
+"""
+Testes da Pasta Monitorada
+
+Chama `HotFolderWatcher.poll()` sobre uma pasta de entrada temporária e confere o índice de
+conversões: arquivos duplicados e já convertidos antes de um reinício são pulados, e um modelo que
+ainda está sendo gravado não é usado até ficar estável.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import os
+import shutil
+import time
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from support import TemplateTestCase
+
+from hotfolder import INDEX_FILENAME, TEMPLATE_FILENAME, HotFolderWatcher
+
+RNG = np.random.default_rng(9)
+MAX_POLLS = 200
+
+
+class HotFolderTest(TemplateTestCase):
+    def setUp(self):
+        self.inbox = self.new_dir()
+        self.output_dir = self.new_dir()
+        shutil.copy(self.template, os.path.join(self.inbox, TEMPLATE_FILENAME))
+
+    def watcher(self):
+        watcher = HotFolderWatcher(self.inbox, workers=1, output_dir=self.output_dir, poll_interval=0)
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def add_image(self, filename, source=None):
+        """Drop a new random page into the inbox, or a copy of `source` (a duplicate drop)."""
+        path = os.path.join(self.inbox, filename)
+        if source:
+            shutil.copy(source, path)
+        else:
+            Image.fromarray(RNG.integers(0, 256, (24, 32), dtype=np.uint8)).save(path)
+        return path
+
+    def poll_until_idle(self, watcher):
+        """Poll until every stable file was converted or skipped."""
+        for _ in range(MAX_POLLS):
+            watcher.poll()
+            if not (watcher._observed or watcher.stats.queued or watcher.stats.in_flight):
+                return
+            time.sleep(0.05)
+        self.fail(f"A pasta não ficou ociosa: {watcher.stats.describe()}")
+
+    def test_duplicate_drop_is_converted_once(self):
+        original = self.add_image("laudo.png")
+        os.makedirs(os.path.join(self.inbox, "reenvio"))
+        self.add_image(os.path.join("reenvio", "laudo (1).png"), source=original) # Same study, via the parent's template
+        watcher = self.watcher()
+        self.poll_until_idle(watcher)
+        self.assertEqual((watcher.stats.converted, watcher.stats.skipped, watcher.stats.failed), (1, 1, 0))
+        self.assertEqual(len(watcher.index.entries), 1)
+        self.assertEqual(len(os.listdir(self.output_dir)), 1)
+
+    def test_restart_skips_converted_files(self):
+        self.add_image("laudo.png")
+        first = self.watcher()
+        self.poll_until_idle(first)
+        first.close()
+        self.assertEqual(first.stats.converted, 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.inbox, INDEX_FILENAME)))
+
+        self.add_image("novo.png")
+        restarted = self.watcher() # Same inbox, so the same index file
+        self.poll_until_idle(restarted)
+        self.assertEqual((restarted.stats.converted, restarted.stats.skipped), (1, 1))
+        self.assertEqual(len(restarted.index.entries), 2)
+
+    def test_unstable_template_is_not_used(self):
+        self.add_image("laudo.png")
+        template = os.path.join(self.inbox, TEMPLATE_FILENAME)
+        watcher = self.watcher()
+        mtime_ns = os.stat(template).st_mtime_ns
+        for _ in range(5): # Still being copied: its mtime changes on every poll
+            mtime_ns += 1_000_000_000
+            os.utime(template, ns=(mtime_ns, mtime_ns))
+            watcher.poll()
+        self.assertEqual(watcher.stats.waiting_template, 1)
+        self.assertEqual((watcher.stats.queued, watcher.stats.in_flight, watcher.stats.converted), (0, 0, 0))
+        self.assertEqual(watcher.index.entries, {})
+
+        self.poll_until_idle(watcher) # Left alone, the template settles and the page is converted
+        self.assertEqual((watcher.stats.converted, watcher.stats.waiting_template), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Testes das Imagens Grandes
+
+Com `LARGE_IMAGE_PIXELS` e `STRIP_PIXELS` reduzidos, imagens pequenas seguem o caminho em faixas
+(`image_pixel_strips` e `multiframe.write_strips`). Os arquivos gerados são decodificados com o
+pydicom e comparados aos do caminho normal, em cada sintaxe de transferência, inclusive com faixas
+que cortam sequências RLE ao meio.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import pydicom
+from PIL import Image
+
+from support import TemplateTestCase
+
+import converter
+from converter import (COMPRESSION_TRANSFER_SYNTAXES, ImageTooLargeError, UnsupportedFileError, _channels_identical,
+                       convert_file, image_pixel_data, image_pixel_strips)
+
+RNG = np.random.default_rng(13)
+STRIP_PIXELS = 700 # A few rows per strip for the images below
+
+
+def sample_images():
+    """Name -> PIL image covering each conversion path, all with odd sizes."""
+    gray = RNG.integers(0, 256, (61, 43), dtype=np.uint8)
+    document = np.full((75, 101), 255, dtype=np.uint8) # Long white runs crossing the strip boundaries
+    document[10:14, 5:90] = 0
+    document[40:70, 50:52] = 20
+    return {
+        "rgb": Image.fromarray(RNG.integers(0, 256, (59, 47, 3), dtype=np.uint8)),
+        "gray_as_rgb": Image.fromarray(np.stack([gray] * 3, axis=-1)),
+        "gray": Image.fromarray(gray),
+        "gray_alpha": Image.fromarray(gray).convert("LA"),
+        "palette": Image.fromarray(RNG.integers(0, 256, (33, 57, 3), dtype=np.uint8)).convert("P"),
+        "bilevel_document": Image.fromarray(document),
+    }
+
+
+class PixelStripsTest(unittest.TestCase):
+    def test_channels_identical(self):
+        gray = RNG.integers(0, 256, (40, 40), dtype=np.uint8)
+        rgb = np.stack([gray] * 3, axis=-1)
+        self.assertTrue(_channels_identical(rgb))
+        rgb[1, 3, 2] ^= 1 # Off the subsampled probe grid: only the full comparison sees it
+        self.assertFalse(_channels_identical(rgb))
+        rgb[1, 3, 2] ^= 1
+        rgb[0, 0, 1] ^= 1 # On the probe grid
+        self.assertFalse(_channels_identical(rgb))
+
+    def test_strips_match_whole_image(self):
+        with mock.patch.object(converter, "STRIP_PIXELS", STRIP_PIXELS):
+            for name, image in sample_images().items():
+                for detect_grayscale in (True, False):
+                    for bilevel in (False, True):
+                        with self.subTest(image=name, detect_grayscale=detect_grayscale, bilevel=bilevel):
+                            pixel_bytes, samples, photometric = image_pixel_data(image, detect_grayscale, bilevel)
+                            strips, strip_samples, strip_photometric = image_pixel_strips(image, detect_grayscale, bilevel)
+                            strips = list(strips)
+                            self.assertGreater(len(strips), 1)
+                            self.assertEqual(sum(rows for _, rows in strips), image.height)
+                            self.assertEqual(b"".join(data for data, _ in strips), pixel_bytes)
+                            self.assertEqual((strip_samples, strip_photometric), (samples, photometric))
+
+
+class LargeImageRoundTripTest(TemplateTestCase):
+    def convert(self, source, large, **options):
+        """Convert `source` through the strip path (`large`) or the in-memory one and read the instances back."""
+        output_dir = self.new_dir()
+        with mock.patch.object(converter, "LARGE_IMAGE_PIXELS", 10 if large else 10 ** 12), \
+                mock.patch.object(converter, "STRIP_PIXELS", STRIP_PIXELS):
+            result = convert_file(self.template, source, output_dir, **options)
+        return [pydicom.dcmread(path) for path in sorted(result.output_files)]
+
+    def assert_same_instances(self, streamed, in_memory, transfer_syntax):
+        self.assertEqual(len(streamed), len(in_memory))
+        for a, b in zip(streamed, in_memory):
+            self.assertEqual(a.file_meta.TransferSyntaxUID, transfer_syntax)
+            self.assertEqual(b.file_meta.TransferSyntaxUID, transfer_syntax)
+            for keyword in ("Rows", "Columns", "SamplesPerPixel", "PhotometricInterpretation"):
+                self.assertEqual(a[keyword].value, b[keyword].value, keyword)
+            np.testing.assert_array_equal(a.pixel_array, b.pixel_array)
+
+    def test_single_frame_round_trip(self):
+        for name, image in sample_images().items():
+            source = os.path.join(self.workdir, f"{name}.png")
+            image.save(source)
+            for compression, transfer_syntax in COMPRESSION_TRANSFER_SYNTAXES.items():
+                with self.subTest(image=name, compression=compression):
+                    options = {"compression": compression, "bilevel": True}
+                    self.assert_same_instances(self.convert(source, True, **options), self.convert(source, False, **options),
+                                               transfer_syntax)
+
+    def test_multiframe_round_trip(self):
+        # Strip-spooled pages of different sizes, one of them color, padded and expanded like the others
+        images = sample_images()
+        pages = [images["gray"], images["rgb"], images["bilevel_document"]]
+        source = os.path.join(self.workdir, "pages.tif")
+        pages[0].save(source, save_all=True, append_images=pages[1:])
+        for compression, transfer_syntax in COMPRESSION_TRANSFER_SYNTAXES.items():
+            with self.subTest(compression=compression):
+                options = {"compression": compression, "multiframe": True}
+                streamed = self.convert(source, True, **options)
+                self.assert_same_instances(streamed, self.convert(source, False, **options), transfer_syntax)
+                self.assertEqual(streamed[0].NumberOfFrames, 3)
+
+    def test_image_limits(self):
+        source = os.path.join(self.workdir, "limit.tif")
+        pages = sample_images()
+        pages["gray"].save(source, save_all=True, append_images=[pages["rgb"]]) # 2623 and 2773 pixels
+        output_dir = self.new_dir()
+        with mock.patch.object(converter, "MAX_IMAGE_PIXELS", 2700):
+            with self.assertRaisesRegex(ImageTooLargeError, "47x59"): # Checked per frame, not only on the first
+                convert_file(self.template, source, output_dir)
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000): # Pillow's own check, if re-enabled
+            with self.assertRaises(ImageTooLargeError):
+                convert_file(self.template, source, output_dir)
+        garbage = os.path.join(self.workdir, "garbage.png")
+        with open(garbage, "wb") as f:
+            f.write(b"not an image")
+        with self.assertRaisesRegex(UnsupportedFileError, "garbage.png"):
+            convert_file(self.template, garbage, output_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
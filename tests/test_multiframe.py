@@ -0,0 +1,92 @@
+"""
+Testes da Gravação Multi-frame
+
+Confere, decodificando com o pydicom, que as instâncias multi-frame gravadas em fluxo por
+`multiframe.write_multiframe` (sem compressão, RLE e Deflate) têm exatamente os pixels esperados,
+incluindo o preenchimento com branco de páginas menores e a expansão de páginas em tons de cinza
+para RGB.
+
+Autor: Julio Cesar Nather Junior
+Ano: 2025
+"""
+
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+import pydicom
+from PIL import Image
+
+from support import TemplateTestCase
+
+import converter
+from converter import COMPRESSION_TRANSFER_SYNTAXES, PixelDataTooLargeError, convert_file
+from multiframe import PAD_VALUE
+
+RNG = np.random.default_rng(7)
+
+
+def save_tiff(path, pages):
+    """Save the NumPy `pages` (2-D gray or 3-D RGB) as one multi-page TIFF."""
+    images = [Image.fromarray(page) for page in pages]
+    images[0].save(path, save_all=True, append_images=images[1:])
+
+
+def expected_frames(pages):
+    """Pages padded with white to the largest size, expanded to RGB when any page is color."""
+    rows = max(p.shape[0] for p in pages)
+    columns = max(p.shape[1] for p in pages)
+    color = any(p.ndim == 3 for p in pages)
+    frames = np.full((len(pages), rows, columns) + ((3,) if color else ()), PAD_VALUE, dtype=np.uint8)
+    for frame, page in zip(frames, pages):
+        frame[:page.shape[0], :page.shape[1]] = page[..., None] if color and page.ndim == 2 else page
+    return frames
+
+
+class MultiframeRoundTripTest(TemplateTestCase):
+    def convert(self, pages, compression, **options):
+        source = os.path.join(self.workdir, f"pages_{compression}.tif")
+        save_tiff(source, pages)
+        result = convert_file(self.template, source, self.new_dir(), compression=compression, multiframe=True, **options)
+        self.assertEqual(len(result.output_files), 1)
+        return pydicom.dcmread(result.output_files[0])
+
+    def test_mixed_sizes_and_color_round_trip(self):
+        # Odd sizes, a color page and gray pages that are taller and narrower than it
+        pages = [RNG.integers(0, 256, (37, 51, 3), dtype=np.uint8),
+                 RNG.integers(0, 256, (50, 23), dtype=np.uint8),
+                 np.full((9, 13), 40, dtype=np.uint8)]
+        for compression, transfer_syntax in COMPRESSION_TRANSFER_SYNTAXES.items():
+            with self.subTest(compression=compression):
+                ds = self.convert(pages, compression, encode_workers=2)
+                self.assertEqual(ds.file_meta.TransferSyntaxUID, transfer_syntax)
+                self.assertEqual(ds.NumberOfFrames, 3)
+                self.assertEqual(ds.PhotometricInterpretation, "RGB")
+                np.testing.assert_array_equal(ds.pixel_array, expected_frames(pages))
+
+    def test_gray_pages_stay_monochrome(self):
+        gray = RNG.integers(0, 256, (31, 17), dtype=np.uint8)
+        pages = [np.stack([gray] * 3, axis=-1), RNG.integers(0, 256, (12, 29), dtype=np.uint8)]
+        for compression in COMPRESSION_TRANSFER_SYNTAXES:
+            with self.subTest(compression=compression):
+                ds = self.convert(pages, compression)
+                self.assertEqual(ds.PhotometricInterpretation, "MONOCHROME2")
+                self.assertEqual(ds.SamplesPerPixel, 1)
+                np.testing.assert_array_equal(ds.pixel_array, expected_frames([gray, pages[1]]))
+
+    def test_pixel_data_length_limit(self):
+        # Two 20x30 gray pages fit under the lowered limit; the color third page would need 3 x 1800 bytes
+        pages = [np.zeros((20, 30), dtype=np.uint8), np.zeros((20, 30), dtype=np.uint8),
+                 RNG.integers(0, 256, (20, 30, 3), dtype=np.uint8)]
+        with mock.patch.object(converter, "MAX_PIXEL_DATA_LENGTH", 5000):
+            for compression in ("none", "deflate"):
+                with self.subTest(compression=compression):
+                    with self.assertRaisesRegex(PixelDataTooLargeError, "página 3"):
+                        self.convert(pages, compression)
+            ds = self.convert(pages, "rle") # Encapsulated frames are not bound by the element length
+            np.testing.assert_array_equal(ds.pixel_array, expected_frames(pages))
+
+
+if __name__ == "__main__":
+    unittest.main()